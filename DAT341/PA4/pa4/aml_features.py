@@ -0,0 +1,201 @@
+"""This file contains feature extraction steps that can be used in front of
+the learners in aml_perceptron.py, either in a scikit-learn pipeline or when
+training one chunk at a time with partial_fit.
+
+HashingTfidfVectorizer computes TF-IDF vectors using feature hashing: each
+word is mapped to a column by a hash function, so no vocabulary has to be
+stored. The document frequencies used for the IDF weights are counted in an
+array of fixed size, and can be updated one chunk of documents at a time
+with partial_fit. The memory used is therefore bounded, no matter how large
+the vocabulary is, and the features can be computed in one pass.
+
+RandomFourierFeatures maps the feature vectors into a dense low-dimensional
+space where the dot products approximate an RBF kernel (Rahimi and Recht,
+2007). A linear learner trained on these features behaves approximately like
+a kernel SVM or kernel logistic regression, but the training time stays
+linear in the number of instances. The number of components trades off
+speed against the quality of the approximation.
+"""
+
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+# When computing random features, the rows of the input matrix are processed
+# in chunks of this many rows, so that only one chunk of the intermediate
+# products is kept in memory in double precision.
+FEATURE_CHUNK_SIZE = 10000
+
+
+class HashingTfidfVectorizer(BaseEstimator, TransformerMixin):
+    """
+    TF-IDF vectors with feature hashing and an incrementally estimated IDF.
+
+    The IDF weights are computed as in scikit-learn's TfidfVectorizer with
+    smooth_idf=True, from the document frequencies of the hashed columns.
+    If use_idf is False, no fitting is needed, and only the term frequencies
+    are used.
+    """
+
+    def __init__(self, n_features=2**20, use_idf=True, sublinear_tf=False,
+                 norm='l2', lowercase=True, token_pattern=r"(?u)\b\w\w+\b",
+                 ngram_range=(1, 1)):
+        """
+        The constructor takes the number of hashed columns, the TF-IDF
+        options, and the options for the tokenization.
+        """
+        self.n_features = n_features
+        self.use_idf = use_idf
+        self.sublinear_tf = sublinear_tf
+        self.norm = norm
+        self.lowercase = lowercase
+        self.token_pattern = token_pattern
+        self.ngram_range = ngram_range
+
+    def hashing_vectorizer(self):
+        """
+        The HashingVectorizer that computes the term frequencies.
+        """
+        return HashingVectorizer(n_features=self.n_features, alternate_sign=False,
+                                 norm=None, lowercase=self.lowercase,
+                                 token_pattern=self.token_pattern,
+                                 ngram_range=self.ngram_range)
+
+    def reset_counts(self):
+        """
+        Sets the document frequencies and the number of documents to zero.
+        """
+        self.df_ = np.zeros(self.n_features, dtype=np.int64)
+        self.n_docs_ = 0
+
+    def count_documents(self, X):
+        """
+        Adds the documents in the term frequency matrix X to the document
+        frequencies.
+        """
+        if self.use_idf:
+            # Each column occurs at most once in each row of the CSR matrix.
+            self.df_ += np.bincount(X.indices, minlength=self.n_features)
+        self.n_docs_ += X.shape[0]
+
+    def partial_fit(self, docs, y=None):
+        """
+        Updates the document frequencies with a chunk of documents.
+        """
+        if not hasattr(self, 'df_'):
+            self.reset_counts()
+        self.count_documents(self.hashing_vectorizer().transform(docs))
+        return self
+
+    def partial_fit_transform(self, docs, y=None):
+        """
+        Updates the document frequencies with a chunk of documents and
+        computes their TF-IDF vectors, hashing the documents only once.
+        """
+        if not hasattr(self, 'df_'):
+            self.reset_counts()
+        X = self.hashing_vectorizer().transform(docs)
+        self.count_documents(X)
+        return self.weight(X)
+
+    def fit(self, docs, y=None):
+        """
+        Estimates the document frequencies from a list of documents.
+        """
+        self.reset_counts()
+        return self.partial_fit(docs)
+
+    def fit_transform(self, docs, y=None):
+        """
+        Estimates the document frequencies and computes the TF-IDF vectors,
+        hashing the documents only once.
+        """
+        self.reset_counts()
+        return self.partial_fit_transform(docs)
+
+    def transform(self, docs):
+        """
+        Computes the TF-IDF vectors for a list of documents, using the
+        document frequencies seen so far.
+        """
+        return self.weight(self.hashing_vectorizer().transform(docs))
+
+    def idf(self, columns):
+        """
+        Computes the IDF weights for the given columns.
+        """
+        return np.log((1 + self.n_docs_) / (1 + self.df_[columns])) + 1
+
+    @property
+    def idf_(self):
+        """
+        The IDF weights of all columns.
+        """
+        return self.idf(slice(None))
+
+    def weight(self, X):
+        """
+        Converts a term frequency matrix into TF-IDF vectors. The IDF weights
+        are only computed for the nonzero entries of X.
+        """
+        X = X.astype(np.float64)
+        if self.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1
+        if self.use_idf:
+            if not hasattr(self, 'df_'):
+                raise Exception("the IDF weights have not been estimated: call fit or partial_fit first")
+            X.data *= self.idf(X.indices)
+        if self.norm is not None:
+            X = normalize(X, norm=self.norm, copy=False)
+        return X
+
+
+class RandomFourierFeatures(BaseEstimator, TransformerMixin):
+    """
+    Random Fourier features for the RBF kernel exp(-gamma*|x-x'|^2). Each
+    instance x is mapped to sqrt(2/n_components) * cos(W^T x + b), where the
+    columns of W are drawn from a normal distribution with variance 2*gamma,
+    and b is drawn uniformly from [0, 2*pi]. The input can be dense or
+    sparse, and the output is a dense float32 matrix, which is computed
+    chunk_size rows at a time.
+    """
+
+    def __init__(self, n_components=1000, gamma=1.0, random_state=None,
+                 chunk_size=FEATURE_CHUNK_SIZE):
+        """
+        The constructor takes the number of random features, the parameter
+        gamma of the kernel, and a seed for the random projection.
+        """
+        self.n_components = n_components
+        self.gamma = gamma
+        self.random_state = random_state
+        self.chunk_size = chunk_size
+
+    def fit(self, X, y=None):
+        """
+        Draws the random projection for the number of input features of X.
+        """
+        rng = np.random.RandomState(self.random_state)
+        self.random_weights_ = (np.sqrt(2 * self.gamma) *
+                                rng.randn(X.shape[1], self.n_components)).astype(np.float32)
+        self.random_offset_ = rng.uniform(0, 2*np.pi, self.n_components).astype(np.float32)
+        return self
+
+    def transform(self, X):
+        """
+        Computes the random features for the inputs X.
+        """
+        if X.shape[1] != self.random_weights_.shape[0]:
+            raise Exception("the number of features does not match the random projection")
+        scale = np.float32(np.sqrt(2 / self.n_components))
+        Z = np.empty((X.shape[0], self.n_components), dtype=np.float32)
+        for start in range(0, X.shape[0], self.chunk_size):
+            end = min(start + self.chunk_size, X.shape[0])
+            projection = X[start:end].dot(self.random_weights_)
+            projection += self.random_offset_
+            np.cos(projection, out=projection)
+            projection *= scale
+            Z[start:end] = projection
+        return Z
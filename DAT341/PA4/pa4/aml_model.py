@@ -0,0 +1,229 @@
+"""This file implements a compact on-disk format for the linear classifiers
+in aml_perceptron.py, together with their feature extraction, and a command
+line tool that scores a text file with a stored model.
+
+A model is stored in a directory with the following files:
+
+- weights.npy: the weight vector (or the weight matrix, for OneVsRest),
+  stored as float32.
+- idf.npy: the IDF weights of the features, if TF-IDF is used.
+- model.json: the class labels, and the parameters of the feature
+  extraction: the vocabulary, or the parameters of the feature hashing.
+
+The arrays are loaded with np.load(..., mmap_mode='r'), which returns a
+np.memmap. Loading is then instant, and processes that load the same model
+share the memory pages of the weights.
+
+A feature selection step (e.g. SelectKBest) is folded into the vocabulary,
+so only the selected terms are stored. This gives the same features as the
+original pipeline, since scaling a document vector by a constant (such as
+the normalization before the selection) does not change the result of a
+later normalization.
+
+To score a text file with one document per line:
+
+    python aml_model.py model_dir documents.txt
+"""
+
+import argparse
+import json
+import os
+import sys
+from itertools import islice
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer, TfidfVectorizer
+from sklearn.preprocessing import Normalizer, normalize
+
+from aml_features import HashingTfidfVectorizer
+from aml_perceptron import OneVsRest
+
+# The parameters of the scikit-learn vectorizers that we store. Other
+# parameters either do not affect the features, or are handled separately.
+ANALYZER_PARAMS = ['analyzer', 'binary', 'lowercase', 'ngram_range',
+                   'stop_words', 'strip_accents', 'token_pattern']
+HASHING_PARAMS = ['n_features', 'alternate_sign']
+
+
+def vectorizer_params(vectorizer, names):
+    """
+    Returns the parameters in names of a vectorizer, checking that they can
+    be stored as JSON.
+    """
+    params = vectorizer.get_params()
+    if callable(params['analyzer']) or params.get('preprocessor') or params.get('tokenizer'):
+        raise Exception("vectorizers with custom analyzers can not be stored")
+    return {name: params[name] for name in names}
+
+def save_model(directory, pipeline):
+    """
+    Stores a trained pipeline in the compact format. The pipeline should
+    consist of a TfidfVectorizer, CountVectorizer, HashingVectorizer or
+    HashingTfidfVectorizer, optionally followed by feature selection and Normalizer steps, and a
+    linear classifier from aml_perceptron.py at the end.
+    """
+    steps = [step for _, step in pipeline.steps]
+    vectorizer, transforms, classifier = steps[0], steps[1:-1], steps[-1]
+
+    meta = {}
+    idf = None
+    sublinear_tf = False
+
+    if isinstance(vectorizer, HashingVectorizer):
+        meta['vectorizer'] = 'hashing'
+        meta['params'] = vectorizer_params(vectorizer, ANALYZER_PARAMS + HASHING_PARAMS)
+        columns = np.arange(vectorizer.n_features)
+    elif isinstance(vectorizer, HashingTfidfVectorizer):
+        meta['vectorizer'] = 'hashing'
+        meta['params'] = vectorizer_params(vectorizer.hashing_vectorizer(), ANALYZER_PARAMS + HASHING_PARAMS)
+        columns = np.arange(vectorizer.n_features)
+        sublinear_tf = vectorizer.sublinear_tf
+        if vectorizer.use_idf:
+            idf = vectorizer.idf_
+    elif isinstance(vectorizer, CountVectorizer):
+        meta['vectorizer'] = 'vocabulary'
+        meta['params'] = vectorizer_params(vectorizer, ANALYZER_PARAMS)
+        terms = vectorizer.get_feature_names_out()
+        columns = np.arange(len(terms))
+        if isinstance(vectorizer, TfidfVectorizer):
+            sublinear_tf = vectorizer.sublinear_tf
+            if vectorizer.use_idf:
+                idf = vectorizer.idf_
+    else:
+        raise Exception(f"can not store a pipeline starting with {type(vectorizer).__name__}")
+
+    # The normalization of the output vectors. Two normalizations after each
+    # other are the same as the last one, but a normalization followed by a
+    # feature selection can not be stored, unless a normalization follows.
+    norm = getattr(vectorizer, 'norm', None)
+    stale_norm = False
+    for step in transforms:
+        if hasattr(step, 'get_support'):
+            columns = columns[step.get_support()]
+            stale_norm = stale_norm or norm is not None
+        elif isinstance(step, Normalizer):
+            norm = step.norm
+            stale_norm = False
+        else:
+            raise Exception(f"can not store a pipeline step {type(step).__name__}")
+    if stale_norm:
+        raise Exception("a normalization before a feature selection must be followed by a Normalizer")
+
+    if meta['vectorizer'] == 'vocabulary':
+        meta['vocabulary'] = [str(term) for term in terms[columns]]
+    else:
+        meta['columns'] = columns.tolist() if len(columns) < vectorizer.n_features else None
+
+    meta['sublinear_tf'] = sublinear_tf
+    meta['idf'] = idf is not None
+    meta['norm'] = norm
+
+    meta['multiclass'] = isinstance(classifier, OneVsRest)
+    meta['classes'] = classifier.classes_.tolist()
+    weights = classifier.W if meta['multiclass'] else classifier.w
+
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, 'weights.npy'), weights.astype(np.float32))
+    idf_file = os.path.join(directory, 'idf.npy')
+    if idf is not None:
+        np.save(idf_file, idf[columns].astype(np.float32))
+    elif os.path.exists(idf_file):
+        os.remove(idf_file)
+    with open(os.path.join(directory, 'model.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+
+class CompactModel:
+    """
+    A model loaded from the compact format. It computes the same features as
+    the stored pipeline, and has the predict and decision_function methods of
+    a pipeline, taking a list of documents as input.
+    """
+
+    def __init__(self, directory):
+        """
+        Loads the model stored in directory. The arrays are memory-mapped.
+        """
+        with open(os.path.join(directory, 'model.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+
+        self.classes_ = np.array(meta['classes'])
+        self.multiclass = meta['multiclass']
+        self.sublinear_tf = meta['sublinear_tf']
+        self.norm = meta['norm']
+
+        self.W = np.load(os.path.join(directory, 'weights.npy'), mmap_mode='r')
+        self.idf = None
+        if meta['idf']:
+            self.idf = np.load(os.path.join(directory, 'idf.npy'), mmap_mode='r')
+
+        params = meta['params']
+        params['ngram_range'] = tuple(params['ngram_range'])
+        if meta['vectorizer'] == 'hashing':
+            self.vectorizer = HashingVectorizer(norm=None, **params)
+            self.columns = meta['columns']
+        else:
+            self.vectorizer = CountVectorizer(vocabulary=meta['vocabulary'], **params)
+            self.columns = None
+
+    def transform(self, docs):
+        """
+        Computes the feature matrix for a list of documents.
+        """
+        X = self.vectorizer.transform(docs).astype(np.float32)
+        if self.columns is not None:
+            X = X[:, self.columns]
+        if self.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1
+        if self.idf is not None:
+            X.data *= self.idf[X.indices]
+        if self.norm is not None:
+            X = normalize(X, norm=self.norm, copy=False)
+        return X
+
+    def decision_function(self, docs):
+        """
+        Computes the scores for a list of documents.
+        """
+        return self.transform(docs).dot(self.W)
+
+    def predict(self, docs):
+        """
+        Predicts the outputs for a list of documents.
+        """
+        scores = self.decision_function(docs)
+        if self.multiclass:
+            return self.classes_[np.argmax(scores, axis=1)]
+        return self.classes_[(scores >= 0.0).astype(np.intp)]
+
+
+def score_file(model, input_file, output, chunk_size=10000):
+    """
+    Scores a text file with one document per line, chunk_size lines at a
+    time, and writes the predicted label and the score for each line.
+    """
+    with open(input_file, encoding='utf-8') as f:
+        while True:
+            docs = list(islice(f, chunk_size))
+            if not docs:
+                break
+            scores = model.decision_function(docs)
+            if model.multiclass:
+                indices = np.argmax(scores, axis=1)
+                scores = scores[np.arange(len(docs)), indices]
+            else:
+                indices = (scores >= 0.0).astype(np.intp)
+            for label, score in zip(model.classes_[indices], scores):
+                output.write(f'{label}\t{score:.6f}\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scores a text file with one document per line using a stored model')
+    parser.add_argument('-c', '--chunk-size', help='Number of lines to score at a time', default=10000, type=int)
+    parser.add_argument('model', help='Directory of the stored model')
+    parser.add_argument('input', help='Text file with one document per line')
+    args = parser.parse_args()
+
+    model = CompactModel(args.model)
+    score_file(model, args.input, sys.stdout, args.chunk_size)
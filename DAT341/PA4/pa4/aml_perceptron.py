@@ -8,25 +8,63 @@ matrices, and SparsePerceptron, which uses sparse vectors and matrices.
 The latter may be faster when we have high-dimensional feature representations
 with a lot of zeros, such as when we are using a "bag of words" representation
 of documents.
+
+The Pegasos learners, PegasosSVC and PegasosLR, train linear SVMs and logistic
+regression classifiers. They work with dense as well as sparse matrices.
+
+All learners can optionally be trained in mini-batches (the batch_size
+parameter), where a whole block of instances is scored with one matrix product
+and the updates for the block are applied in one step. The Pegasos learners
+can also use the projection step of the Pegasos paper (projection=True).
+
+The binary learners can be used for multi-class problems with OneVsRest,
+which trains one binary classifier per class in a pool of processes.
+
+SparsePerceptron and the Pegasos learners can also be trained with Hogwild
+(the n_jobs parameter): several processes work on disjoint parts of the
+training set and update one weight vector in shared memory without locking.
+This works well for sparse text data, where most updates touch disjoint sets
+of features. The Pegasos learners can also be trained with iterative
+parameter mixing (ParameterMixing), where the workers train separate copies
+of the weight vector on their parts of the training set, and the copies are
+averaged after each epoch.
+
+DualCDSVC trains the same linear SVM as PegasosSVC, but with dual coordinate
+descent, the algorithm used in liblinear. It usually needs far fewer passes
+over the training set to reach a given value of the objective.
 """
 
+import copy
+import multiprocessing as mp
+import time
+from multiprocessing import shared_memory
+
 import numpy as np
-from sklearn.base import BaseEstimator
+import scipy.sparse as sp
+from sklearn.base import BaseEstimator, clone
+
+# When computing scores, the rows of the input matrix are processed in chunks
+# of this many rows, so that the memory needed for a large sparse matrix is
+# bounded.
+SCORING_CHUNK_SIZE = 100000
 
 class LinearClassifier(BaseEstimator):
     """
     General class for binary linear classifiers. Implements the predict
     function, which is the same for all binary linear classifiers. There are
-    also two utility functions.
+    also some utility functions.
     """
 
-    def decision_function(self, X):
+    def decision_function(self, X, chunk_size=SCORING_CHUNK_SIZE):
         """
         Computes the decision function for the inputs X. The inputs are assumed to be
         stored in a matrix, where each row contains the features for one
-        instance.
+        instance. The rows are processed in chunks of chunk_size rows.
         """
-        return X.dot(self.w)
+        scores = np.empty(X.shape[0])
+        for chunk in minibatches(X.shape[0], chunk_size):
+            scores[chunk] = X[chunk].dot(self.w)
+        return scores
 
     def predict(self, X):
         """
@@ -39,12 +77,9 @@ class LinearClassifier(BaseEstimator):
         scores = self.decision_function(X)
 
         # Select the positive or negative class label, depending on whether
-        # the score was positive or negative.
-        out = np.select([scores >= 0.0, scores < 0.0],
-                        [self.positive_class,
-                         self.negative_class],
-                         default='Other')
-        return out
+        # the score was positive or negative. We compute the index of the class
+        # (0 or 1) for each instance, and look up all labels in one step.
+        return self.classes_[(scores >= 0.0).astype(np.intp)]
 
     def find_classes(self, Y):
         """
@@ -53,9 +88,11 @@ class LinearClassifier(BaseEstimator):
         classifier scores, the other one to negative scores. If the number of
         classes is not 2, an error is raised.
         """
-        classes = sorted(set(Y))
+        classes = np.unique(np.asarray(Y))
         if len(classes) != 2:
-            raise Exception("this does not seem to be a 2-class problem")
+            raise Exception("this does not seem to be a 2-class problem "
+                            "(use OneVsRest for multi-class problems)")
+        self.classes_ = classes
         self.positive_class = classes[1]
         self.negative_class = classes[0]
 
@@ -63,7 +100,32 @@ class LinearClassifier(BaseEstimator):
         """
         A helper function that converts all outputs to +1 or -1.
         """
-        return np.array([1 if y == self.positive_class else -1 for y in Y])
+        return np.where(np.asarray(Y) == self.positive_class, 1, -1)
+
+    def start_partial_fit(self, X, classes):
+        """
+        A helper function for incremental training with partial_fit. In the
+        first call, the set of output classes must be given, and the weight
+        vector is initialized to all zeros.
+        """
+        if not hasattr(self, 'w'):
+            if classes is None:
+                raise Exception("the classes must be given in the first call to partial_fit")
+            self.find_classes(classes)
+            self.w = np.zeros(X.shape[1])
+        elif X.shape[1] != len(self.w):
+            raise Exception("the number of features does not match the weight vector")
+
+    def objective(self, X, Y):
+        """
+        Computes the value of the objective function, the mean loss plus the
+        regularisation term, for the current weight vector on the data X, Y.
+        The subclass must define the method loss and the regularisation
+        parameter lambda_reg, as Pegasos and DualCDSVC do.
+        """
+        margins = self.encode_outputs(Y)*self.decision_function(X)
+        reg_term = 0.5 * self.lambda_reg * np.dot(self.w, self.w)
+        return self.loss(margins).mean() + reg_term
 
 
 class Perceptron(LinearClassifier):
@@ -71,12 +133,14 @@ class Perceptron(LinearClassifier):
     A straightforward implementation of the perceptron learning algorithm.
     """
 
-    def __init__(self, n_iter=20):
+    def __init__(self, n_iter=20, batch_size=None):
         """
         The constructor can optionally take a parameter n_iter specifying how
-        many times we want to iterate through the training set.
+        many times we want to iterate through the training set. If batch_size
+        is given, the training set is processed in mini-batches of this size.
         """
         self.n_iter = n_iter
+        self.batch_size = batch_size
 
     def fit(self, X, Y):
         """
@@ -99,6 +163,13 @@ class Perceptron(LinearClassifier):
         n_features = X.shape[1]
         self.w = np.zeros(n_features)
 
+        if self.batch_size:
+            # Mini-batch perceptron algorithm:
+            for i in range(self.n_iter):
+                for batch in minibatches(X.shape[0], self.batch_size):
+                    perceptron_batch_step(X[batch], Ye[batch], self.w)
+            return
+
         # Perceptron algorithm:
         for i in range(self.n_iter):
             for x, y in zip(X, Ye):
@@ -131,19 +202,74 @@ def sparse_dense_dot(x, w):
     """
     return np.dot(w[x.indices], x.data)
 
+def weighted_row_sum(X, coef):
+    """
+    Computes the weighted sum X.T.dot(coef) of the rows of X, as a pair
+    (cols, vals) of the features and their values. If X is sparse, cols
+    contains only the features that occur in X; if X is dense, cols selects
+    all features.
+    """
+    if isinstance(X, np.ndarray):
+        return slice(None), X.T.dot(coef)
+    s = sp.csr_matrix(coef).dot(X)
+    return s.indices, s.data
+
+def add_rows_to_dense(X, coef, w, factor):
+    """
+    Adds a weighted sum of the rows of X, scaled by some factor, to a dense
+    vector. This is the equivalent of w += factor * X.T.dot(coef). X can be
+    a dense or a sparse matrix; if it is sparse, only the features that occur
+    in X are touched.
+    """
+    cols, vals = weighted_row_sum(X, coef)
+    w[cols] += factor * vals
+
+
+### Utilities for mini-batch training.
+
+def minibatches(n_examples, batch_size):
+    """
+    Splits the positions 0, ..., n_examples-1 into consecutive slices of
+    length batch_size (the last one may be shorter).
+    """
+    for start in range(0, n_examples, batch_size):
+        yield slice(start, min(start + batch_size, n_examples))
+
+def perceptron_batch_step(Xb, Yb, w):
+    """
+    One mini-batch step of the perceptron: all instances in the batch Xb are
+    scored with one matrix product, and the misclassified ones are added to
+    the weight vector w in one step.
+    """
+    scores = Xb.dot(w)
+    add_rows_to_dense(Xb, np.where(Yb*scores <= 0, Yb, 0.0), w, 1.0)
+
 
 class SparsePerceptron(LinearClassifier):
     """
     A straightforward implementation of the perceptron learning algorithm,
     assuming that the input feature matrix X is sparse.
+
+    If average is True, we train an averaged perceptron: the final weight
+    vector is the average of the weight vectors after each step. To avoid
+    adding the whole weight vector to a sum after every step, we keep for
+    each feature the step when its weight last changed, and when it changes
+    again, we add the old weight times the number of steps it was unchanged.
+    The cost of the averaging is then proportional to the nonzeros of the
+    rows where we make updates.
     """
 
-    def __init__(self, n_iter=20):
+    def __init__(self, n_iter=20, batch_size=None, n_jobs=1, average=False):
         """
         The constructor can optionally take a parameter n_iter specifying how
-        many times we want to iterate through the training set.
+        many times we want to iterate through the training set. If batch_size
+        is given, the training set is processed in mini-batches of this size.
+        If n_jobs is more than 1, we train with Hogwild in n_jobs processes.
         """
         self.n_iter = n_iter
+        self.batch_size = batch_size
+        self.n_jobs = n_jobs
+        self.average = average
 
     def fit(self, X, Y):
         """
@@ -158,42 +284,282 @@ class SparsePerceptron(LinearClassifier):
         # and negative scores, respectively.
         Ye = self.encode_outputs(Y)
 
+        if self.average and (self.batch_size or self.n_jobs > 1):
+            raise Exception("the averaged perceptron does not use mini-batches or Hogwild")
+
+        if self.n_jobs > 1:
+            train_hogwild(self, X, Ye, self.n_jobs)
+            return
+
         # Initialize the weight vector to all zeros.
         self.w = np.zeros(X.shape[1])
 
+        if self.average:
+            # Averaged perceptron algorithm:
+            self.start_averaging(X.shape[1])
+            XY = list(zip(X, Ye))
+            for i in range(self.n_iter):
+                self.averaged_pass(XY)
+            self.finish_averaging()
+            return
+
+        if self.batch_size:
+            # Mini-batch perceptron algorithm:
+            X = X.tocsr()
+            for i in range(self.n_iter):
+                self.batch_pass(X, Ye)
+            return
+
         # Iteration through sparse matrices can be a bit slow, so we first
         # prepare this list to speed up iteration.
         XY = list(zip(X, Ye))
 
         for i in range(self.n_iter):
-            for x, y in XY:
+            self.online_pass(XY)
 
-                # Compute the output score for this instance.
-                # (This corresponds to score = x.dot(self.w) above.)
-                score = sparse_dense_dot(x, self.w)
+    def partial_fit(self, X, Y, classes=None):
+        """
+        Runs one pass of the perceptron over a chunk X, Y of the training set,
+        continuing from the current weight vector. This allows us to train on
+        a training set that does not fit in memory, one chunk at a time. The
+        set of classes must be given in the first call.
+        """
+        self.start_partial_fit(X, classes)
+        Ye = self.encode_outputs(Y)
+
+        if self.average:
+            if not hasattr(self, 'steps_'):
+                self.start_averaging(X.shape[1])
+            self.averaged_pass(zip(X, Ye))
+            self.finish_averaging()
+        elif self.batch_size:
+            self.batch_pass(X.tocsr(), Ye)
+        else:
+            self.online_pass(zip(X, Ye))
+        return self
+
+    def online_pass(self, XY):
+        """
+        One pass of the perceptron algorithm over the (x, y) pairs in XY.
+        """
+        for x, y in XY:
+
+            # Compute the output score for this instance.
+            # (This corresponds to score = x.dot(self.w) above.)
+            score = sparse_dense_dot(x, self.w)
+
+            # If there was an error, update the weights.
+            if y*score <= 0:
+                # (This corresponds to self.w += y*x above.)
+                add_sparse_to_dense(x, self.w, y)
+
+    def start_averaging(self, n_features):
+        """
+        Initializes the state of the averaged perceptron: the current weight
+        vector, the sums of the weights over the steps, the step when each
+        feature's sum was last brought up to date, and the number of steps.
+        """
+        self.current_w_ = np.zeros(n_features)
+        self.w_sum_ = np.zeros(n_features)
+        self.last_update_ = np.zeros(n_features)
+        self.steps_ = 0
+
+    def averaged_pass(self, XY):
+        """
+        One pass of the averaged perceptron algorithm over the (x, y) pairs in
+        XY. The perceptron itself works with the current weight vector.
+        """
+        w = self.current_w_
+        w_sum = self.w_sum_
+        last_update = self.last_update_
+        step = self.steps_
+
+        for x, y in XY:
+            step += 1
+
+            # Compute the output score for this instance.
+            score = sparse_dense_dot(x, w)
+
+            # If there was an error, update the weights. Before that, add the
+            # old weights for the steps since they last changed to the sums.
+            if y*score <= 0:
+                cols = x.indices
+                w_sum[cols] += (step - 1 - last_update[cols]) * w[cols]
+                last_update[cols] = step - 1
+                add_sparse_to_dense(x, w, y)
+
+        self.steps_ = step
+
+    def finish_averaging(self):
+        """
+        Brings the sums of all weights up to date, and stores the average
+        weight vector in w.
+        """
+        w_sum = self.w_sum_ + (self.steps_ - self.last_update_) * self.current_w_
+        self.w = w_sum / max(self.steps_, 1)
+
+    def batch_pass(self, X, Ye):
+        """
+        One pass of the mini-batch perceptron algorithm over the CSR matrix X.
+        """
+        for batch in minibatches(X.shape[0], self.batch_size):
+            perceptron_batch_step(X[batch], Ye[batch], self.w)
+
+    def hogwild_arrays(self, n_features):
+        """
+        The arrays that are shared by the Hogwild workers: the weight vector.
+        """
+        return {'w': np.zeros(n_features)}
+
+    def hogwild_epochs(self, X, Ye, rows, worker_id, n_workers, w):
+        """
+        The work done by one Hogwild worker: runs the perceptron over the
+        given rows of the CSR matrix X, updating the shared weight vector w in
+        place. The rows are read directly from the shared arrays of X, without
+        copying them.
+        """
+        indptr, indices, data = X.indptr, X.indices, X.data
+        for epoch in range(self.n_iter):
+            for i in rows:
+                # The nonzero features of this instance.
+                cols = indices[indptr[i]:indptr[i+1]]
+                vals = data[indptr[i]:indptr[i+1]]
+                y = Ye[i]
 
                 # If there was an error, update the weights.
-                if y*score <= 0:
-                    # (This corresponds to self.w += y*x above.)
-                    add_sparse_to_dense(x, self.w, y)
+                if y*np.dot(w[cols], vals) <= 0:
+                    w[cols] += y * vals
+
+    def finish_hogwild(self, w):
+        """
+        Stores the weight vector after Hogwild training.
+        """
+        self.w = w
 
 
-class PegasosSVC(LinearClassifier):
+def sigmoid(z):
     """
-    A straightforward implementation of the Pegasos algorithm for training linear SVM Classifiers.
+    Computes the logistic function 1/(1+exp(-z)) for an array z, in a way that
+    does not overflow: for negative z, we use exp(z)/(1+exp(z)) instead.
+    """
+    e = np.exp(-np.abs(z))
+    return np.where(z >= 0, 1 / (1 + e), e / (1 + e))
+
+
+# If the scale factor of a scaled weight vector becomes smaller than this, the
+# scale factor is folded into the vector to avoid numerical underflow.
+MIN_SCALE = 1e-9
+
+
+def print_progress(info):
+    """
+    A callback for the Pegasos learners that prints the objective after each
+    epoch.
+    """
+    print(f"Epoch {info['epoch']}, Objective: {info['objective']:.4f}")
+    print(f"Mean Loss: {info['mean_loss']:.4f}, Regularization Term: {info['reg_term']:.4f}")
+
+
+class Pegasos(LinearClassifier):
+    """
+    Common implementation of the Pegasos algorithm. The subclasses define which
+    loss function we minimize, by implementing the methods loss and
+    loss_gradient.
+
+    If the input feature matrix X is dense, we work with normal NumPy vectors.
+    If it is sparse, we work directly with the rows of the CSR matrix, and the
+    weight vector is stored as a scale factor times a vector. The
+    regularisation step then only changes the scale factor, so each step costs
+    O(1) plus the number of nonzeros of the row, rather than O(n_features).
+
+    If batch_size is given, each step uses a mini-batch of that many instances
+    instead of a single instance, as in the mini-batch version of Pegasos in
+    the paper: the subgradients are averaged over the batch, and the scores
+    for the whole batch are computed with one matrix product.
+
+    If projection is True, each step ends with the optional projection step
+    of the paper: if the norm of the weight vector is larger than
+    projection_radius, the vector is scaled down onto the ball of that
+    radius, which contains the optimal weight vector. To make this cheap for
+    sparse data, we keep track of the squared norm of the weight vector, and
+    update it using only the features touched by each step.
+
+    The step counter t is kept in the attribute t_, so that training can be
+    continued on new data with partial_fit.
+
+    If warm_start is True, fit starts from the previous solution instead of
+    from zero; this is used by lambda_path. After t steps, the weight vector
+    is 1/(lambda*t) times the sum of the subgradients, so the previous
+    solution is first rescaled by old lambda / new lambda, which keeps the
+    average subgradient. The step counter is then restarted after one epoch,
+    so that the previous solution counts as much as one epoch of steps. (If
+    it were restarted at 1, the first step would set w to zero, and if it
+    were kept, the steps would be too small to move away from the previous
+    solution.)
+
+    If n_jobs is more than 1, the training set is split between n_jobs
+    processes that run Pegasos with Hogwild, i.e. they update a shared weight
+    vector without locking. Since the shared vector cannot be stored with a
+    scale factor, the regularisation is applied lazily: for each feature we
+    store the step when it was last updated, and since the shrink factors
+    (1-1/s) multiply to last/t over the steps s = last+1, ..., t, the feature
+    can be brought up to date in O(1) when it is next used. The workers do
+    not stop between epochs, so Hogwild training always runs n_iter epochs,
+    without early stopping, callbacks or history_.
+
+    After each epoch of fit, a dictionary with information about the epoch
+    (see epoch_info) is stored in the list history_ and passed to the
+    function callback, if given; training stops if the callback returns True.
+    Use callback=print_progress to print the objective after each epoch. If
+    tol is given, training stops early when the objective has not improved by
+    at least tol for n_iter_no_change epochs. If validation_fraction is also
+    given, that part of the training set is held out, and the loss on it is
+    used instead of the objective.
     """
 
-    def __init__(self, lambda_reg=0.001, n_iter=40):
+    def __init__(self, lambda_reg=0.001, n_iter=40, batch_size=None,
+                 projection=False, n_jobs=1, tol=None, n_iter_no_change=2,
+                 validation_fraction=None, callback=None, warm_start=False):
         """
         The constructor can optionally take a parameter n_iter specifying how
         many times we want to iterate through the training set.
         """
         self.n_iter = n_iter
         self.lambda_reg = lambda_reg
+        self.batch_size = batch_size
+        self.projection = projection
+        self.n_jobs = n_jobs
+        self.tol = tol
+        self.n_iter_no_change = n_iter_no_change
+        self.validation_fraction = validation_fraction
+        self.callback = callback
+        self.warm_start = warm_start
+
+    def loss(self, margin):
+        """
+        Computes the loss for an instance, given the margin y*score. The
+        margin can also be an array of margins.
+        """
+        raise NotImplementedError
+
+    def loss_gradient(self, margin):
+        """
+        Computes the factor g such that the update for the loss is
+        w += eta*g*y*x, given the margin y*score.
+        """
+        raise NotImplementedError
+
+    def projection_radius(self):
+        """
+        The radius of a ball that contains the optimal weight vector. The
+        objective is loss(0) for w = 0, so at the optimum we must have
+        0.5*lambda*|w|^2 <= loss(0).
+        """
+        return np.sqrt(2 * self.loss(0.0) / self.lambda_reg)
 
     def fit(self, X, Y):
         """
-        Train a linear classifier using the Pergasos learning algorithm.
+        Train a linear classifier using the Pegasos learning algorithm.
         """
 
         # First determine which output class will be associated with positive
@@ -203,117 +569,847 @@ class PegasosSVC(LinearClassifier):
         # Convert all outputs to +1 (for the positive class) or -1 (negative).
         Ye = self.encode_outputs(Y)
 
-        # If necessary, convert the sparse matrix returned by a vectorizer
-        # into a normal NumPy matrix.
         if not isinstance(X, np.ndarray):
-            X = X.toarray()
+            X = X.tocsr()
+
+        if self.n_jobs > 1:
+            if self.batch_size:
+                raise Exception("Hogwild training does not use mini-batches")
+            if self.projection:
+                raise Exception("Hogwild training does not use the projection step")
+            if self.warm_start:
+                raise Exception("Hogwild training does not use warm starts")
+            if self.tol is not None or self.validation_fraction:
+                raise Exception("Hogwild training does not use early stopping")
+            if self.callback is not None:
+                raise Exception("Hogwild training does not use callbacks")
+            train_hogwild(self, X, Ye, self.n_jobs)
+            self.history_ = []
+            self.n_iter_ = self.n_iter
+            return
+
+        # If we use a validation set, we hold out a random part of the rows.
+        rows = np.arange(X.shape[0])
+        if self.validation_fraction:
+            rows = np.random.permutation(X.shape[0])
+            n_validation = int(self.validation_fraction * len(rows))
+            Xval, Yval = X[rows[:n_validation]], Ye[rows[:n_validation]]
+            rows = rows[n_validation:]
+
+        # Initialize the weight vector to all zeros, unless we continue from
+        # the previous solution (see the class documentation).
+        if self.warm_start and hasattr(self, 'w'):
+            if X.shape[1] != len(self.w):
+                raise Exception("the number of features does not match the weight vector")
+            self.w = self.w * (self.fit_lambda_ / self.lambda_reg)
+            self.t_ = len(rows) + 1
+        else:
+            self.w = np.zeros(X.shape[1])
+            self.t_ = 1
+        self.fit_lambda_ = self.lambda_reg
+
+        self.history_ = []
+        best_score = np.inf
+        no_change = 0
 
-        # Initialize the weight vector to all zeros.
-        n_features = X.shape[1]
-        n_examples = X.shape[0]
-        self.w = np.zeros(n_features)
+        for epoch in range(self.n_iter):
+            t0 = time.time()
+            mean_loss, n_updates = self.run_epoch(X, Ye, rows)
+            t1 = time.time()
+
+            info = self.epoch_info(epoch, t1-t0, len(rows), mean_loss, n_updates)
+            if self.validation_fraction:
+                margins = Yval*self.decision_function(Xval)
+                info['validation_loss'] = float(self.loss(margins).mean())
+            self.history_.append(info)
+
+            if self.callback is not None and self.callback(info):
+                break
+
+            # Stop early if the objective (or validation loss) has not
+            # improved by at least tol for n_iter_no_change epochs.
+            if self.tol is not None:
+                score = info.get('validation_loss', info['objective'])
+                if score > best_score - self.tol:
+                    no_change += 1
+                else:
+                    no_change = 0
+                best_score = min(best_score, score)
+                if no_change >= self.n_iter_no_change:
+                    break
 
-        t = 1
+        self.n_iter_ = len(self.history_)
 
-        # Perceptron algorithm:
-        for epoch in range(self.n_iter):
-            total_loss = 0.0
-            # shuffle to similate random sampling
-            idx = np.random.permutation(n_examples)
-            X_shuffled, Ye_shuffled = X[idx], Ye[idx]
+    def partial_fit(self, X, Y, classes=None):
+        """
+        Runs one epoch of the Pegasos algorithm over a chunk X, Y of the
+        training set, continuing from the current weight vector and step
+        counter. This allows us to train on a training set that does not fit
+        in memory, one chunk at a time. The set of classes must be given in
+        the first call.
+        """
+        self.start_partial_fit(X, classes)
+        self.t_ = getattr(self, 't_', 1)
+        Ye = self.encode_outputs(Y)
+
+        if not isinstance(X, np.ndarray):
+            X = X.tocsr()
+
+        self.run_epoch(X, Ye)
+        return self
+
+    def run_epoch(self, X, Ye, rows=None):
+        """
+        Runs one epoch over the training set X and outputs Ye encoded as +1 or
+        -1, and returns the mean loss over the epoch and the number of updates
+        for the loss. If rows is given, the epoch only visits these rows of X.
+        """
+        if rows is None:
+            rows = np.arange(X.shape[0])
 
-            for x, y in zip(X_shuffled, Ye_shuffled):
+        if self.batch_size:
+            return self.batch_epoch(X, Ye, rows)
+        elif isinstance(X, np.ndarray):
+            return self.dense_epoch(X, Ye, rows)
+        else:
+            return self.sparse_epoch(X, Ye, rows)
+
+    def dense_epoch(self, X, Ye, rows):
+        """
+        One epoch of the Pegasos algorithm for a dense feature matrix X.
+        """
+        n_examples = len(rows)
+        t = self.t_
+
+        if self.projection:
+            radius = self.projection_radius()
+
+        total_loss = 0.0
+        n_updates = 0
+        # Visit the rows in random order to simulate random sampling. We go
+        # through a permutation of the row indices rather than making a
+        # shuffled copy of X, since each row X[i] is just a view.
+        for i in np.random.permutation(rows):
+            x = X[i]
+            y = Ye[i]
+
+            # learning rate
+            eta = 1.0 / (self.lambda_reg * t)
+
+            # Compute the output score for this instance.
+            margin = y*np.dot(x, self.w)
+            total_loss += self.loss(margin)
+
+            # pegasos update rule: loss + regularisation
+            g = self.loss_gradient(margin)
+            if g != 0:
+                self.w = (1-eta*self.lambda_reg)*self.w + eta*g*y*x
+                n_updates += 1
+            else:
+                self.w = (1-eta*self.lambda_reg)*self.w
+
+            # projection onto the ball that contains the optimum
+            if self.projection:
+                norm = np.linalg.norm(self.w)
+                if norm > radius:
+                    self.w *= radius / norm
+            t += 1
+
+        self.t_ = t
+        return total_loss / n_examples, n_updates
+
+    def sparse_epoch(self, X, Ye, rows):
+        """
+        One epoch of the Pegasos algorithm for a CSR feature matrix X. During
+        the epoch, the weight vector is represented as scale*v.
+        """
+        n_examples = len(rows)
+        indptr, indices, data = X.indptr, X.indices, X.data
+        t = self.t_
+
+        v = self.w
+        scale = 1.0
+
+        # the squared norm of v, if we use the projection step
+        if self.projection:
+            radius = self.projection_radius()
+            sq_norm = np.dot(v, v)
+
+        total_loss = 0.0
+        n_updates = 0
+        # visit the rows in random order to simulate random sampling
+        for i in np.random.permutation(rows):
+            # learning rate
+            eta = 1.0 / (self.lambda_reg * t)
+
+            # The nonzero features of this instance.
+            cols = indices[indptr[i]:indptr[i+1]]
+            vals = data[indptr[i]:indptr[i+1]]
+            y = Ye[i]
+
+            # Compute the output score for this instance.
+            margin = y*scale*np.dot(v[cols], vals)
+            total_loss += self.loss(margin)
+
+            # regularisation: w = (1-eta*lambda)*w only changes the scale
+            scale *= 1 - eta*self.lambda_reg
+            if scale < MIN_SCALE:
+                v *= scale
+                scale = 1.0
+                if self.projection:
+                    sq_norm = np.dot(v, v)
+
+            # loss: w += eta*g*y*x, where w = scale*v
+            g = self.loss_gradient(margin)
+            if g != 0:
+                delta = (eta*g*y/scale) * vals
+                if self.projection:
+                    sq_norm += 2*np.dot(v[cols], delta) + np.dot(delta, delta)
+                v[cols] += delta
+                n_updates += 1
+
+            # projection: only changes the scale
+            if self.projection:
+                norm = scale*np.sqrt(max(sq_norm, 0.0))
+                if norm > radius:
+                    scale *= radius / norm
+            t += 1
+
+        v *= scale
+        self.t_ = t
+        return total_loss / n_examples, n_updates
+
+    def batch_epoch(self, X, Ye, rows):
+        """
+        One epoch of the mini-batch Pegasos algorithm for a dense or CSR
+        feature matrix X. As in sparse_epoch, the weight vector is represented
+        as scale*v during the epoch. Only one batch of shuffled rows is copied
+        out of X at a time.
+        """
+        n_examples = len(rows)
+        t = self.t_
+
+        v = self.w
+        scale = 1.0
+
+        # the squared norm of v, if we use the projection step
+        if self.projection:
+            radius = self.projection_radius()
+            sq_norm = np.dot(v, v)
+
+        total_loss = 0.0
+        n_updates = 0
+        idx = np.random.permutation(rows)
+
+        for batch in minibatches(n_examples, self.batch_size):
+            rows = idx[batch]
+            Xb, Yb = X[rows], Ye[rows]
+
+            # learning rate
+            eta = 1.0 / (self.lambda_reg * t)
+
+            # Compute the margins for the whole batch.
+            margins = Yb*scale*Xb.dot(v)
+            total_loss += self.loss(margins).sum()
+
+            # regularisation
+            scale *= 1 - eta*self.lambda_reg
+            if scale < MIN_SCALE:
+                v *= scale
+                scale = 1.0
+                if self.projection:
+                    sq_norm = np.dot(v, v)
+
+            # loss: the subgradients are averaged over the batch
+            coef = self.loss_gradient(margins)*Yb
+            cols, vals = weighted_row_sum(Xb, coef)
+            delta = (eta/(len(rows)*scale)) * vals
+            if self.projection:
+                sq_norm += 2*np.dot(v[cols], delta) + np.dot(delta, delta)
+            v[cols] += delta
+            n_updates += np.count_nonzero(coef)
+
+            # projection: only changes the scale
+            if self.projection:
+                norm = scale*np.sqrt(max(sq_norm, 0.0))
+                if norm > radius:
+                    scale *= radius / norm
+            t += 1
+
+        v *= scale
+        self.t_ = t
+        return total_loss / n_examples, n_updates
+
+    def hogwild_arrays(self, n_features):
+        """
+        The arrays that are shared by the Hogwild workers: the weight vector,
+        and for each feature the step when it was last brought up to date.
+        """
+        return {'w': np.zeros(n_features), 'last': np.zeros(n_features)}
+
+    def hogwild_epochs(self, X, Ye, rows, worker_id, n_workers, w, last):
+        """
+        The work done by one Hogwild worker: runs Pegasos over the given rows
+        of the CSR matrix X, updating the shared arrays w and last in place.
+        The workers take turns in the global sequence of steps, so this worker
+        uses the steps worker_id+1, worker_id+1+n_workers, and so on.
+        """
+        indptr, indices, data = X.indptr, X.indices, X.data
+        t = worker_id + 1
+
+        for epoch in range(self.n_iter):
+            for i in np.random.permutation(rows):
                 # learning rate
                 eta = 1.0 / (self.lambda_reg * t)
 
+                # The nonzero features of this instance.
+                cols = indices[indptr[i]:indptr[i+1]]
+                vals = data[indptr[i]:indptr[i+1]]
+                y = Ye[i]
+
+                # Apply the regularisation of steps last+1, ..., t-1 to these
+                # features. (Another worker may have been ahead of us.)
+                seen = last[cols]
+                if t > 1:
+                    w[cols] *= np.minimum(seen / (t-1), 1.0)
+
                 # Compute the output score for this instance.
-                score = np.dot(x, self.w)
+                margin = y*np.dot(w[cols], vals)
+
+                # pegasos update rule: regularisation of step t + loss. The
+                # features that another worker has already brought past step
+                # t are not shrunk again.
+                w[cols] *= np.where(seen < t, 1 - eta*self.lambda_reg, 1.0)
+                g = self.loss_gradient(margin)
+                if g != 0:
+                    w[cols] += (eta*g*y) * vals
+
+                # A worker that is behind must not move last backwards, or
+                # the steps in between would be applied twice.
+                last[cols] = np.maximum(last[cols], t)
+                t += n_workers
+
+    def finish_hogwild(self, w, last):
+        """
+        Applies the remaining regularisation to all features after Hogwild
+        training, and stores the weight vector.
+        """
+        self.t_ = int(last.max()) + 1
+        self.w = w * last / max(last.max(), 1)
 
-                # hinge loss
-                hinge_loss = max(0, 1 - y*score)
-                total_loss += hinge_loss
+    def epoch_info(self, epoch, seconds, n_examples, mean_loss, n_updates):
+        """
+        Collects the information about an epoch that is passed to the
+        callback. The objective is computed from the mean loss during the
+        epoch, so no extra pass over the training set is needed.
+        """
+        squared_norm = float(np.dot(self.w, self.w))
+        reg_term = 0.5 * self.lambda_reg * squared_norm
+        return {
+            'epoch': epoch+1,
+            'time': seconds,
+            'examples_per_sec': n_examples / seconds if seconds > 0 else float('inf'),
+            'n_updates': int(n_updates),
+            'mean_loss': float(mean_loss),
+            'reg_term': reg_term,
+            'objective': float(mean_loss) + reg_term,
+            'weight_norm': squared_norm ** 0.5,
+        }
+
+
+class PegasosSVC(Pegasos):
+    """
+    A straightforward implementation of the Pegasos algorithm for training linear SVM Classifiers.
+    """
 
-                # pegasos update rule
-                if y*score < 1:
-                    # hinge loss + regularisation
-                    self.w = (1-eta*self.lambda_reg)*self.w + eta*y*x
-                else:
-                    # regularisation
-                    self.w = (1-eta*self.lambda_reg)*self.w
-                t += 1
-            
-            mean_loss = total_loss / n_examples
-            reg_term = 0.5 * self.lambda_reg * np.dot(self.w, self.w)
-            objective = mean_loss + reg_term
-            print(f"Epoch {epoch+1}/{self.n_iter}, Objective: {objective:.4f}")
-            print(f"Mean Loss: {mean_loss:.4f}, Regularization Term: {reg_term:.4f}")
+    def loss(self, margin):
+        """
+        The hinge loss.
+        """
+        return np.maximum(0, 1 - margin)
+
+    def loss_gradient(self, margin):
+        """
+        The hinge loss has a nonzero subgradient only if the margin is below 1.
+        """
+        return 1.0*(margin < 1)
+
+    def projection_radius(self):
+        """
+        For the hinge loss, the paper shows the tighter bound 1/sqrt(lambda).
+        """
+        return 1 / np.sqrt(self.lambda_reg)
 
 
-class PegasosLR(LinearClassifier):
+class PegasosLR(Pegasos):
     """
     A straightforward implementation of the Pegasos algorithm for training logistic regression classifiers.
     """
 
-    def __init__(self, lambda_reg=0.001, n_iter=40):
+    def loss(self, margin):
         """
-        The constructor can optionally take a parameter n_iter specifying how
-        many times we want to iterate through the training set.
+        The log loss.
+        """
+        return np.log(1 + np.exp(-margin))
+
+    def loss_gradient(self, margin):
+        """
+        The negative derivative of the log loss with respect to the margin.
+        """
+        return 1.0 / (1 + np.exp(margin))
+
+    def predict_proba(self, X):
+        """
+        Computes the probabilities of the negative and positive classes for
+        the inputs X. The output is a matrix with one row for each instance
+        and one column for each class, in the order of classes_.
+        """
+        p = sigmoid(self.decision_function(X))
+        return np.column_stack([1 - p, p])
+
+
+class DualCDSVC(LinearClassifier):
+    """
+    A linear SVM trained with dual coordinate descent (Hsieh et al., 2008),
+    as in liblinear. It minimizes the same objective as PegasosSVC,
+
+        lambda/2 * |w|^2 + mean hinge loss,
+
+    which is the liblinear objective 1/2*|w|^2 + C * sum of hinge losses with
+    C = 1/(lambda*n). In the dual problem, there is one variable alpha_i for
+    each instance, with 0 <= alpha_i <= C, and w = sum of alpha_i*y_i*x_i. In
+    each pass, we visit the instances in random order and solve the dual
+    problem exactly for one alpha_i at a time, keeping w up to date. Each
+    step costs the number of nonzeros of the row, like a Pegasos step.
+
+    With shrinking, an instance whose alpha_i is at a bound (0 or C) and
+    whose gradient shows that it will stay there is removed from the active
+    set, so the later passes only visit the instances that may still change.
+    Training stops when the projected gradients over the active set differ by
+    less than tol; all instances are then checked once more before stopping.
+
+    After each pass, a dictionary with information about the pass is stored
+    in the list history_ and passed to the function callback, if given;
+    training stops if the callback returns True.
+    """
+
+    def __init__(self, lambda_reg=0.001, n_iter=1000, tol=0.1, shrinking=True,
+                 callback=None):
+        """
+        The constructor takes the regularisation parameter, as for PegasosSVC,
+        the maximal number of passes over the training set, and the stopping
+        tolerance.
         """
-        self.n_iter = n_iter
         self.lambda_reg = lambda_reg
+        self.n_iter = n_iter
+        self.tol = tol
+        self.shrinking = shrinking
+        self.callback = callback
+
+    # the same hinge loss as PegasosSVC
+    loss = PegasosSVC.loss
 
     def fit(self, X, Y):
         """
-        Train a linear classifier using the Pergasos learning algorithm.
+        Train a linear SVM using dual coordinate descent.
         """
-
-        # First determine which output class will be associated with positive
-        # and negative scores, respectively.
         self.find_classes(Y)
-
-        # Convert all outputs to +1 (for the positive class) or -1 (negative).
         Ye = self.encode_outputs(Y)
 
-        # If necessary, convert the sparse matrix returned by a vectorizer
-        # into a normal NumPy matrix.
-        if not isinstance(X, np.ndarray):
-            X = X.toarray()
+        sparse = not isinstance(X, np.ndarray)
+        if sparse:
+            X = X.tocsr()
+            indptr, indices, data = X.indptr, X.indices, X.data
+            squared_norms = np.asarray(X.multiply(X).sum(axis=1)).ravel()
+        else:
+            squared_norms = np.einsum('ij,ij->i', X, X)
 
-        # Initialize the weight vector to all zeros.
-        n_features = X.shape[1]
         n_examples = X.shape[0]
-        self.w = np.zeros(n_features)
+        C = 1.0 / (self.lambda_reg * n_examples)
+        alpha = np.zeros(n_examples)
+        self.w = w = np.zeros(X.shape[1])
 
-        t = 1
+        # Instances without features do not affect w, so we skip them.
+        active = np.flatnonzero(squared_norms > 0)
+        n_nonempty = len(active)
 
-        # Perceptron algorithm:
+        # The bounds on the projected gradient used for shrinking.
+        max_bound = np.inf
+        min_bound = -np.inf
+
+        self.history_ = []
         for epoch in range(self.n_iter):
-            total_loss = 0.0
-            # shuffle to similate random sampling
-            idx = np.random.permutation(n_examples)
-            X_shuffled, Ye_shuffled = X[idx], Ye[idx]
+            t0 = time.time()
+            max_pg = -np.inf
+            min_pg = np.inf
+            keep = np.ones(len(active), dtype=bool)
+
+            # visit the active instances in random order
+            order = np.random.permutation(len(active))
+            for k in order:
+                i = active[k]
+                if sparse:
+                    cols = indices[indptr[i]:indptr[i+1]]
+                    vals = data[indptr[i]:indptr[i+1]]
+                else:
+                    cols = slice(None)
+                    vals = X[i]
+                y = Ye[i]
+
+                # The gradient of the dual objective with respect to alpha_i,
+                # and the projected gradient, which is zero if alpha_i is at a
+                # bound and the gradient points out of the feasible interval.
+                g = y*np.dot(w[cols], vals) - 1
+                pg = 0.0
+                if alpha[i] == 0:
+                    if self.shrinking and g > max_bound:
+                        keep[k] = False
+                        continue
+                    pg = min(g, 0.0)
+                elif alpha[i] == C:
+                    if self.shrinking and g < min_bound:
+                        keep[k] = False
+                        continue
+                    pg = max(g, 0.0)
+                else:
+                    pg = g
+                max_pg = max(max_pg, pg)
+                min_pg = min(min_pg, pg)
+
+                # Solve for alpha_i exactly, and update w accordingly.
+                if pg != 0:
+                    old_alpha = alpha[i]
+                    alpha[i] = min(max(old_alpha - g/squared_norms[i], 0.0), C)
+                    w[cols] += (alpha[i] - old_alpha)*y * vals
+
+            active = active[keep]
+            t1 = time.time()
+
+            info = {
+                'epoch': epoch+1,
+                'time': t1-t0,
+                'n_active': len(active),
+                'violation': float(max_pg - min_pg) if len(active) > 0 else 0.0,
+            }
+            self.history_.append(info)
+            if self.callback is not None and self.callback(info):
+                break
+
+            if info['violation'] < self.tol:
+                if len(active) == n_nonempty:
+                    break
+                # Converged on the active set: check all instances again.
+                active = np.flatnonzero(squared_norms > 0)
+                max_bound = np.inf
+                min_bound = -np.inf
+                continue
+
+            max_bound = max_pg if max_pg > 0 else np.inf
+            min_bound = min_pg if min_pg < 0 else -np.inf
+
+        self.n_iter_ = len(self.history_)
+        self.alpha_ = alpha
+
+
+def lambda_path(estimator, Xtrain, Ytrain, Xval, Yval, lambdas, tol=1e-3):
+    """
+    Trains a Pegasos learner for a sequence of values of lambda_reg, and
+    evaluates each model on a validation set. The values are visited from the
+    largest to the smallest, and each fit starts from the solution of the
+    previous one (warm_start), with early stopping when the objective changes
+    by less than tol. Since the solutions for nearby values of lambda are
+    close to each other, each fit after the first one usually needs only a
+    few epochs.
+
+    Returns the values of lambda in the order they were visited, a copy of
+    the model for each value, and the accuracy of each model on the
+    validation set.
+    """
+    lambdas = sorted(lambdas, reverse=True)
+    classifier = clone(estimator)
+    classifier.set_params(warm_start=True, tol=tol)
 
-            for x, y in zip(X_shuffled, Ye_shuffled):
-                # learning rate
-                eta = 1.0 / (self.lambda_reg * t)
+    models = []
+    scores = []
+    for lambda_reg in lambdas:
+        classifier.set_params(lambda_reg=lambda_reg)
+        classifier.fit(Xtrain, Ytrain)
+        models.append(copy.deepcopy(classifier))
+        scores.append(float(np.mean(classifier.predict(Xval) == np.asarray(Yval))))
+    return lambdas, models, scores
 
-                # Compute the output score for this instance.
-                score = np.dot(x, self.w)
-
-                # log loss
-                log_loss = np.log(1 + np.exp(-y*score))
-                total_loss += log_loss
-
-                # pegasoslr update rule
-                exp = np.exp(y*score)
-                grad = (y * x) / (1 + exp)
-
-                # update weight
-                self.w = (1-eta*self.lambda_reg)*self.w + eta*grad
-                t += 1
-            
-            mean_loss = total_loss / n_examples
-            reg_term = 0.5 * self.lambda_reg * np.dot(self.w, self.w)
-            objective = mean_loss + reg_term
-            print(f"Epoch {epoch+1}/{self.n_iter}, Objective: {objective:.4f}")
-            print(f"Mean Loss: {mean_loss:.4f}, Regularization Term: {reg_term:.4f}")
\ No newline at end of file
+
+### Utilities for training in several processes. The feature matrix is put
+### in shared memory, so that the worker processes can read it without
+### receiving pickled copies of it.
+
+def share_array(a):
+    """
+    Copies a NumPy array into a new block of shared memory. Returns the block
+    and a description (name, shape, dtype) that can be sent to other processes
+    and passed to attach_array.
+    """
+    block = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+    np.ndarray(a.shape, a.dtype, buffer=block.buf)[...] = a
+    return block, (block.name, a.shape, a.dtype.str)
+
+def attach_array(description):
+    """
+    Attaches to a shared array created by share_array. Returns the block,
+    which must be kept alive while the array is used, and the array.
+    """
+    name, shape, dtype = description
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype, buffer=block.buf)
+
+def share_matrix(X):
+    """
+    Copies a dense or sparse matrix into shared memory. Returns the list of
+    blocks, which the caller should close and unlink when the workers are
+    done, and a description of the matrix to be passed to attach_matrix.
+    """
+    if isinstance(X, np.ndarray):
+        block, description = share_array(X)
+        return [block], ('dense', description)
+    X = X.tocsr()
+    shared = [share_array(a) for a in (X.data, X.indices, X.indptr)]
+    blocks = [block for block, _ in shared]
+    return blocks, ('csr', [description for _, description in shared], X.shape)
+
+def attach_matrix(description):
+    """
+    Attaches to a matrix created by share_matrix. Returns the list of blocks,
+    which must be kept alive while the matrix is used, and the matrix.
+    """
+    if description[0] == 'dense':
+        block, X = attach_array(description[1])
+        return [block], X
+    _, arrays, shape = description
+    blocks, (data, indices, indptr) = zip(*(attach_array(a) for a in arrays))
+    return list(blocks), sp.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+
+def release_blocks(blocks):
+    """
+    Closes and removes shared memory blocks created by share_matrix.
+    """
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+# The shared feature matrix, and any other shared arrays, as seen by a worker
+# process in a training pool.
+worker_data = {}
+
+def init_worker(description, arrays=None, seeds=None):
+    """
+    Initializer for the worker processes: attaches to the shared matrix and
+    to the shared arrays described in the dictionary arrays. If seeds is
+    given, the worker takes a seed from this queue and reseeds NumPy's random
+    generator, since forked workers would otherwise all start with a copy of
+    the random state of the parent.
+    """
+    if seeds is not None:
+        np.random.seed(seeds.get())
+    worker_data['blocks'], worker_data['X'] = attach_matrix(description)
+    worker_data['arrays'] = {}
+    for name, array_description in (arrays or {}).items():
+        block, worker_data['arrays'][name] = attach_array(array_description)
+        worker_data['blocks'].append(block)
+
+def make_pool(n_workers, description, arrays=None):
+    """
+    Creates a pool of n_workers processes that attach to the shared matrix
+    and arrays (see init_worker). Each worker is given its own seed, spawned
+    from a seed drawn from NumPy's random generator in this process, so the
+    results can be reproduced with np.random.seed.
+    """
+    seeds = mp.Queue()
+    entropy = np.random.randint(2**32)
+    for seed in np.random.SeedSequence(entropy).spawn(n_workers):
+        seeds.put(seed.generate_state(4))
+    return mp.Pool(n_workers, initializer=init_worker,
+                   initargs=(description, arrays, seeds))
+
+def fit_binary(task):
+    """
+    Trains a binary classifier on the shared feature matrix in a worker
+    process, and returns its weight vector.
+    """
+    classifier, Y = task
+    classifier.fit(worker_data['X'], Y)
+    return classifier.w
+
+
+class OneVsRest(LinearClassifier):
+    """
+    Multi-class classification with one-vs-rest: for each class, we train a
+    binary classifier that separates this class from all the others. The
+    binary classifiers are trained in parallel in a pool of n_jobs processes,
+    which read the feature matrix from shared memory.
+
+    The weight vectors are stacked into a matrix W, so that the scores for all
+    classes are computed with one matrix product X.dot(W).
+    """
+
+    def __init__(self, estimator, n_jobs=1):
+        """
+        The constructor takes a binary learner, such as PegasosSVC(), that
+        will be copied for each class, and the number of processes to use.
+        """
+        self.estimator = estimator
+        self.n_jobs = n_jobs
+
+    def fit(self, X, Y):
+        """
+        Trains one binary classifier for each class.
+        """
+        Y = np.asarray(Y)
+        self.classes_ = np.unique(Y)
+
+        # For each class, the outputs are True for this class and False for
+        # all other classes.
+        tasks = [(clone(self.estimator), Y == c) for c in self.classes_]
+
+        if self.n_jobs == 1:
+            worker_data['X'] = X
+            try:
+                weights = [fit_binary(task) for task in tasks]
+            finally:
+                worker_data.clear()
+        else:
+            blocks, description = share_matrix(X)
+            try:
+                with make_pool(self.n_jobs, description) as pool:
+                    weights = pool.map(fit_binary, tasks)
+            finally:
+                release_blocks(blocks)
+
+        self.W = np.column_stack(weights)
+
+    def decision_function(self, X, chunk_size=SCORING_CHUNK_SIZE):
+        """
+        Computes the scores for all classes. The output is a matrix with one
+        row for each instance and one column for each class. The rows are
+        processed in chunks of chunk_size rows.
+        """
+        scores = np.empty((X.shape[0], self.W.shape[1]))
+        for chunk in minibatches(X.shape[0], chunk_size):
+            scores[chunk] = X[chunk].dot(self.W)
+        return scores
+
+    def predict(self, X):
+        """
+        Predicts the class with the highest score for each instance.
+        """
+        return self.classes_[np.argmax(self.decision_function(X), axis=1)]
+
+
+def hogwild_worker(task):
+    """
+    Runs one Hogwild worker on its part of the shared feature matrix.
+    """
+    classifier, Ye, rows, worker_id, n_workers = task
+    classifier.hogwild_epochs(worker_data['X'], Ye, rows, worker_id, n_workers,
+                              **worker_data['arrays'])
+
+def train_hogwild(classifier, X, Ye, n_workers):
+    """
+    Trains a classifier with Hogwild: the rows of the matrix X are split into
+    n_workers parts, and each part is processed by a separate process. The
+    workers update the arrays returned by classifier.hogwild_arrays, which
+    are kept in shared memory, without any locking. The workers walk through
+    the rows of a CSR matrix, so a dense X is converted first.
+    """
+    X = sp.csr_matrix(X)
+    blocks, description = share_matrix(X)
+
+    shared = {}
+    arrays = {}
+    for name, a in classifier.hogwild_arrays(X.shape[1]).items():
+        block, arrays[name] = share_array(a)
+        blocks.append(block)
+        shared[name] = np.ndarray(a.shape, a.dtype, buffer=block.buf)
+
+    parts = np.array_split(np.arange(X.shape[0]), n_workers)
+    tasks = [(classifier, Ye, rows, k, n_workers) for k, rows in enumerate(parts)]
+    try:
+        with make_pool(n_workers, description, arrays) as pool:
+            pool.map(hogwild_worker, tasks)
+        classifier.finish_hogwild(**{name: a.copy() for name, a in shared.items()})
+    finally:
+        del shared
+        release_blocks(blocks)
+
+
+def mixing_worker(task):
+    """
+    Runs one epoch of a Pegasos learner on its part of the shared training
+    set, and returns the new weight vector, step counter and mean loss.
+    """
+    classifier, rows = task
+    mean_loss, _ = classifier.run_epoch(worker_data['X'], worker_data['arrays']['Ye'], rows)
+    return classifier.w, classifier.t_, mean_loss
+
+
+class ParameterMixing(LinearClassifier):
+    """
+    Distributed training of a Pegasos learner with iterative parameter
+    mixing. The training set is split into n_jobs parts, and in each epoch,
+    each worker process runs one epoch of the learner on its part, starting
+    from the current weight vector. The weight vectors returned by the
+    workers are then averaged, and the average is sent to the workers in the
+    next epoch. The workers do not share any mutable state.
+
+    After training, the time and the value of the objective function for
+    each epoch are stored in epoch_times_ and objectives_.
+    """
+
+    def __init__(self, estimator, n_jobs=2, n_iter=None):
+        """
+        The constructor takes a Pegasos learner, such as PegasosSVC(), and the
+        number of processes to use. If n_iter is not given, the number of
+        epochs of the learner is used.
+        """
+        self.estimator = estimator
+        self.n_jobs = n_jobs
+        self.n_iter = n_iter
+
+    def fit(self, X, Y):
+        """
+        Trains the learner with iterative parameter mixing.
+        """
+        classifier = clone(self.estimator)
+        classifier.find_classes(Y)
+        Ye = classifier.encode_outputs(Y)
+
+        if not isinstance(X, np.ndarray):
+            X = X.tocsr()
+
+        classifier.w = np.zeros(X.shape[1])
+        classifier.t_ = 1
+
+        n_iter = self.n_iter or classifier.n_iter
+        parts = np.array_split(np.arange(X.shape[0]), self.n_jobs)
+        self.epoch_times_ = []
+        self.objectives_ = []
+
+        blocks, description = share_matrix(X)
+        block, Ye_description = share_array(Ye)
+        blocks.append(block)
+        try:
+            with make_pool(self.n_jobs, description, {'Ye': Ye_description}) as pool:
+                for epoch in range(n_iter):
+                    t0 = time.time()
+                    results = pool.map(mixing_worker, [(classifier, rows) for rows in parts])
+                    classifier.w = np.mean([w for w, _, _ in results], axis=0)
+                    classifier.t_ = max(t for _, t, _ in results)
+                    t1 = time.time()
+                    self.epoch_times_.append(t1-t0)
+                    self.objectives_.append(classifier.objective(X, Y))
+        finally:
+            release_blocks(blocks)
+
+        self.classes_ = classifier.classes_
+        self.positive_class = classifier.positive_class
+        self.negative_class = classifier.negative_class
+        self.w = classifier.w
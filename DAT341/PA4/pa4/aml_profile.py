@@ -0,0 +1,175 @@
+"""This file implements a simple profiler for scikit-learn pipelines, which
+measures each step separately instead of timing pipeline.fit as a whole.
+This shows whether the time and memory go to the feature extraction or to
+the learning.
+
+For each stage, we record the wall-clock time, the CPU time of this process,
+the peak memory used during the stage and the memory still held after it
+(both relative to the start of the stage, as measured by tracemalloc, which
+also sees the arrays allocated by NumPy and SciPy), and the shape, number of
+nonzeros and type of the output. The report is written as JSON.
+
+Note that tracemalloc makes each memory allocation slower, which inflates
+the times of stages that allocate many small arrays, such as the Pegasos
+learners. To get reliable times, run once more without memory tracing
+(--no-memory). The CPU time does not include any worker processes.
+
+To profile the pipeline of doc_classification.py:
+
+    python aml_profile.py -o profile.json data/all_sentiment_shuffled.txt
+"""
+
+import argparse
+import contextlib
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import Normalizer
+from sklearn.pipeline import make_pipeline
+from sklearn.feature_selection import SelectKBest
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+
+from aml_perceptron import PegasosLR
+from doc_classification import read_data
+
+
+def output_info(X):
+    """
+    Describes the output of a stage: the shape, the number of nonzeros and
+    the type of a matrix, or the length of a list.
+    """
+    if sp.issparse(X):
+        return {'shape': list(X.shape), 'nnz': int(X.nnz), 'type': X.format, 'dtype': str(X.dtype)}
+    if isinstance(X, np.ndarray):
+        info = {'shape': list(X.shape), 'type': 'dense', 'dtype': str(X.dtype)}
+        if np.issubdtype(X.dtype, np.number):
+            info['nnz'] = int(np.count_nonzero(X))
+        return info
+    return {'shape': [len(X)], 'type': type(X).__name__}
+
+
+class PipelineProfiler:
+    """
+    Collects measurements for the stages of a pipeline. The steps of a
+    pipeline are run one at a time by fit and predict, in the same way as
+    Pipeline.fit and Pipeline.predict, and other stages (such as reading the
+    data) can be measured with the context manager measure. If trace_memory
+    is False, only the times and outputs are recorded.
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = []
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        """
+        Measures the code in a with block as a stage with the given name. The
+        with statement gives a dictionary, where more information about the
+        stage can be stored.
+        """
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        stage = {'stage': name}
+        wall0 = time.perf_counter()
+        cpu0 = time.process_time()
+        try:
+            yield stage
+        finally:
+            wall1 = time.perf_counter()
+            cpu1 = time.process_time()
+            stage['wall_time'] = wall1 - wall0
+            stage['cpu_time'] = cpu1 - cpu0
+            if self.trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                stage['peak_memory_mb'] = (peak - memory_before) / 2**20
+                stage['memory_delta_mb'] = (current - memory_before) / 2**20
+            self.stages.append(stage)
+
+    def fit(self, pipeline, X, Y):
+        """
+        Fits the steps of a pipeline one at a time, and measures each step.
+        """
+        for name, step in pipeline.steps[:-1]:
+            with self.measure(f'fit {name}') as stage:
+                X = step.fit_transform(X, Y)
+            stage.update(output_info(X))
+        name, step = pipeline.steps[-1]
+        with self.measure(f'fit {name}'):
+            step.fit(X, Y)
+        return pipeline
+
+    def predict(self, pipeline, X):
+        """
+        Applies the steps of a fitted pipeline one at a time, and measures
+        each step.
+        """
+        for name, step in pipeline.steps[:-1]:
+            with self.measure(f'transform {name}') as stage:
+                X = step.transform(X)
+            stage.update(output_info(X))
+        name, step = pipeline.steps[-1]
+        with self.measure(f'predict {name}') as stage:
+            Y = step.predict(X)
+        stage.update(output_info(Y))
+        return Y
+
+    def report(self):
+        """
+        Returns the measurements as a dictionary, with the total wall-clock
+        and CPU time and the share of the total time of each stage.
+        """
+        total_wall = sum(stage['wall_time'] for stage in self.stages)
+        total_cpu = sum(stage['cpu_time'] for stage in self.stages)
+        for stage in self.stages:
+            stage['wall_time_share'] = stage['wall_time'] / total_wall if total_wall > 0 else 0.0
+        return {
+            'total_wall_time': total_wall,
+            'total_cpu_time': total_cpu,
+            'stages': self.stages,
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Profiles the stages of the document classification pipeline')
+    parser.add_argument('-o', '--output', help='Output file (default: standard output)')
+    parser.add_argument('--no-memory', help='Do not trace the memory use', action='store_true')
+    parser.add_argument('corpus', help='Corpus file', nargs='?', default='data/all_sentiment_shuffled.txt')
+    args = parser.parse_args()
+
+    profiler = PipelineProfiler(trace_memory=not args.no_memory)
+
+    with profiler.measure('read') as stage:
+        X, Y = read_data(args.corpus)
+        Xtrain, Xtest, Ytrain, Ytest = train_test_split(X, Y, test_size=0.2,
+                                                        random_state=0)
+    stage.update(output_info(X))
+
+    # The same pipeline as in doc_classification.py.
+    pipeline = make_pipeline(
+        TfidfVectorizer(),
+        SelectKBest(k=1000),
+        Normalizer(),
+        PegasosLR(),
+    )
+
+    profiler.fit(pipeline, Xtrain, Ytrain)
+    Yguess = profiler.predict(pipeline, Xtest)
+
+    report = profiler.report()
+    report['accuracy'] = accuracy_score(Ytest, Yguess)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
@@ -0,0 +1,169 @@
+"""A benchmark suite for the learners in aml_perceptron.py.
+
+For each combination of corpus size, vocabulary width and density, we build a
+synthetic sparse corpus that looks like TF-IDF vectors of documents, and
+train each learner on it. For each run, we report the training time, the time
+per epoch, the throughput (examples/sec), the peak memory (RSS) and the
+accuracy on a test set. The results are written as JSON, so that the output
+for two versions of the code can be compared with diff.
+
+Each run is done in a separate process, so that the peak RSS of one run does
+not include the memory used by earlier runs.
+
+Example:
+
+    python benchmark.py --sizes 2000 20000 --features 1000 100000 -o results.json
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+import scipy
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+
+from aml_perceptron import Perceptron, SparsePerceptron, PegasosSVC, PegasosLR
+
+# The learners to benchmark, with the parameters to use.
+LEARNERS = {
+    'Perceptron': lambda n_iter: Perceptron(n_iter=n_iter),
+    'SparsePerceptron': lambda n_iter: SparsePerceptron(n_iter=n_iter),
+    'SparsePerceptron-averaged': lambda n_iter: SparsePerceptron(n_iter=n_iter, average=True),
+    'SparsePerceptron-batch': lambda n_iter: SparsePerceptron(n_iter=n_iter, batch_size=256),
+    'PegasosSVC': lambda n_iter: PegasosSVC(n_iter=n_iter),
+    'PegasosSVC-batch': lambda n_iter: PegasosSVC(n_iter=n_iter, batch_size=256),
+    'PegasosSVC-batch-projected': lambda n_iter: PegasosSVC(n_iter=n_iter, batch_size=256, projection=True),
+    'PegasosLR': lambda n_iter: PegasosLR(n_iter=n_iter),
+    'PegasosLR-batch': lambda n_iter: PegasosLR(n_iter=n_iter, batch_size=256),
+    'PegasosLR-batch-projected': lambda n_iter: PegasosLR(n_iter=n_iter, batch_size=256, projection=True),
+}
+
+# The learners that convert the feature matrix into a dense matrix.
+DENSE_LEARNERS = ['Perceptron']
+
+
+def make_corpus(n_examples, n_features, density, seed=0):
+    """
+    Builds a synthetic corpus: a normalized sparse matrix with positive values,
+    like TF-IDF vectors, and labels given by a sparse linear model with 5%
+    label noise. The feature frequencies follow a power law, like words.
+    """
+    rng = np.random.RandomState(seed)
+    nnz_per_row = max(1, int(density * n_features))
+    frequencies = 1.0 / np.arange(1, n_features+1)
+    frequencies /= frequencies.sum()
+
+    indices = rng.choice(n_features, size=(n_examples, nnz_per_row), p=frequencies)
+    data = rng.exponential(size=indices.size)
+    indptr = np.arange(0, indices.size+1, nnz_per_row)
+    X = sp.csr_matrix((data, indices.ravel(), indptr), shape=(n_examples, n_features))
+    X.sum_duplicates()
+    X = normalize(X)
+
+    w = rng.randn(n_features) * (rng.rand(n_features) < 0.1)
+    Y = np.where(X.dot(w) >= np.median(X.dot(w)), 'pos', 'neg')
+    noise = rng.rand(n_examples) < 0.05
+    Y[noise] = np.where(Y[noise] == 'pos', 'neg', 'pos')
+    return X, Y
+
+def peak_rss_mb():
+    """
+    The peak resident memory of this process, in MB. (On Linux, ru_maxrss is
+    in kilobytes.)
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_benchmark(learner, n_examples, n_features, density, n_iter, seed):
+    """
+    Trains a learner on a synthetic corpus and returns the measurements.
+    This is run in a separate process.
+    """
+    X, Y = make_corpus(n_examples, n_features, density, seed)
+    n_train = int(0.8 * n_examples)
+    Xtrain, Ytrain = X[:n_train], Y[:n_train]
+    Xtest, Ytest = X[n_train:], Y[n_train:]
+
+    np.random.seed(seed)
+    classifier = LEARNERS[learner](n_iter)
+    rss_before = peak_rss_mb()
+    t0 = time.perf_counter()
+    classifier.fit(Xtrain, Ytrain)
+    t1 = time.perf_counter()
+
+    # The Pegasos learners may stop early.
+    n_epochs = getattr(classifier, 'n_iter_', n_iter)
+    return {
+        'fit_time': t1-t0,
+        'epochs': n_epochs,
+        'time_per_epoch': (t1-t0) / n_epochs,
+        'examples_per_sec': n_train * n_epochs / (t1-t0),
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_rss_increase_mb': peak_rss_mb() - rss_before,
+        'accuracy': float(np.mean(classifier.predict(Xtest) == Ytest)),
+    }
+
+def benchmark_worker(queue, args):
+    """
+    Runs a benchmark in a separate process and sends the result back.
+    """
+    queue.put(run_benchmark(*args))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the learners in aml_perceptron.py on synthetic sparse corpora')
+    parser.add_argument('--sizes', help='Numbers of examples', default=[2000, 20000], type=int, nargs='+')
+    parser.add_argument('--features', help='Numbers of features', default=[1000, 100000], type=int, nargs='+')
+    parser.add_argument('--densities', help='Fractions of nonzero features', default=[0.001, 0.01], type=float, nargs='+')
+    parser.add_argument('--learners', help='Learners to benchmark', default=list(LEARNERS), choices=list(LEARNERS), nargs='+')
+    parser.add_argument('-n', '--n-iter', help='Number of epochs', default=10, type=int)
+    parser.add_argument('--max-dense-mb', help='Skip the dense learners if the dense matrix is larger than this', default=1000, type=float)
+    parser.add_argument('--seed', help='Random seed', default=0, type=int)
+    parser.add_argument('-o', '--output', help='Output file (default: standard output)')
+    args = parser.parse_args()
+
+    # Fresh processes, so that the peak RSS is measured separately for each run.
+    context = mp.get_context('spawn')
+
+    results = []
+    for n_examples in args.sizes:
+        for n_features in args.features:
+            for density in args.densities:
+                for learner in args.learners:
+                    result = {
+                        'learner': learner,
+                        'n_examples': n_examples,
+                        'n_features': n_features,
+                        'density': density,
+                        'n_iter': args.n_iter,
+                    }
+                    dense_mb = n_examples * n_features * 8 / 2**20
+                    if learner in DENSE_LEARNERS and dense_mb > args.max_dense_mb:
+                        result['skipped'] = f'dense matrix would need {dense_mb:.0f} MB'
+                    else:
+                        queue = context.Queue()
+                        worker = context.Process(target=benchmark_worker, args=(queue, (
+                            learner, n_examples, n_features, density, args.n_iter, args.seed)))
+                        worker.start()
+                        result.update(queue.get())
+                        worker.join()
+                    results.append(result)
+                    sys.stderr.write(f'{json.dumps(result)}\n')
+
+    report = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'seed': args.seed,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
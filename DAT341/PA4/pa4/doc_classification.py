@@ -1,13 +1,26 @@
 
+import argparse
+import hashlib
+import io
+import json
+import multiprocessing as mp
+import os
+import pickle
+import shutil
+import tempfile
 import time
 
-from sklearn.feature_extraction.text import TfidfVectorizer
+import numpy as np
+import scipy.sparse as sp
+from sklearn.base import clone
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
 from sklearn.preprocessing import Normalizer
 from sklearn.pipeline import make_pipeline
 from sklearn.feature_selection import SelectKBest
 from sklearn.metrics import accuracy_score
 from sklearn.model_selection import train_test_split
 
+from aml_features import RandomFourierFeatures
 from aml_perceptron import Perceptron, SparsePerceptron, PegasosSVC, PegasosLR
 
 # This function reads the corpus, returns a list of documents, and a list
@@ -22,33 +35,311 @@ def read_data(corpus_file):
             Y.append(y)
     return X, Y
 
+# This is a generator version of read_data, which reads the corpus in chunks
+# of chunk_size documents. For each chunk, it yields a list of documents and a
+# list of their polarity labels, so the whole corpus is never kept in memory.
+def read_data_chunks(corpus_file, chunk_size=10000):
+    X = []
+    Y = []
+    with open(corpus_file, encoding='utf-8') as f:
+        for line in f:
+            _, y, _, x = line.split(maxsplit=3)
+            X.append(x.strip())
+            Y.append(y)
+            if len(X) == chunk_size:
+                yield X, Y
+                X = []
+                Y = []
+    if X:
+        yield X, Y
+
+# Trains a classifier out-of-core: each chunk of the corpus is read,
+# vectorized and passed to the classifier's partial_fit, and is then dropped.
+# The vectorizer must either not need to be fitted, e.g. a HashingVectorizer,
+# or be fitted incrementally with partial_fit, e.g. a HashingTfidfVectorizer.
+# If the vectorizer has partial_fit_transform, the documents of the first pass
+# are only tokenized once. The set of classes must be known in advance.
+def train_streaming(corpus_file, vectorizer, classifier, classes,
+                    chunk_size=10000, n_passes=1):
+    for i in range(n_passes):
+        for X, Y in read_data_chunks(corpus_file, chunk_size):
+            if i == 0 and hasattr(vectorizer, 'partial_fit_transform'):
+                X = vectorizer.partial_fit_transform(X)
+            else:
+                if i == 0 and hasattr(vectorizer, 'partial_fit'):
+                    vectorizer.partial_fit(X)
+                X = vectorizer.transform(X)
+            classifier.partial_fit(X, Y, classes=classes)
+    return classifier
+
+# Splits a file into n_shards byte ranges of roughly equal size. Each range
+# starts at the beginning of a line and ends after the end of a line, so no
+# line is split between two ranges.
+def byte_ranges(corpus_file, n_shards):
+    size = os.path.getsize(corpus_file)
+    starts = [0]
+    with open(corpus_file, 'rb') as f:
+        for i in range(1, n_shards):
+            f.seek(max(size * i // n_shards, starts[-1]))
+            if f.tell() > 0:
+                # Move to the start of the next line, unless we are already
+                # at the start of a line.
+                f.seek(f.tell() - 1)
+                f.readline()
+            starts.append(f.tell())
+    starts.append(size)
+    return [(start, end) for start, end in zip(starts, starts[1:]) if end > start]
+
+# Reads the lines in a byte range of the corpus and counts the words in the
+# documents. This is run in a worker process. It returns the labels, the
+# sorted vocabulary of the range, and the matrix of word counts, where the
+# columns follow the order of the vocabulary.
+def count_shard(task):
+    corpus_file, start, end, lowercase, token_pattern = task
+    with open(corpus_file, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    X = []
+    Y = []
+    for line in io.TextIOWrapper(io.BytesIO(data), encoding='utf-8'):
+        _, y, _, x = line.split(maxsplit=3)
+        X.append(x.strip())
+        Y.append(y)
+    vectorizer = CountVectorizer(lowercase=lowercase, token_pattern=token_pattern)
+    counts = vectorizer.fit_transform(X)
+    return Y, vectorizer.get_feature_names_out(), counts
+
+# Reads the corpus and counts the words of the documents in parallel: the file
+# is split into byte ranges, and each range is read and tokenized by a worker
+# process. The vocabularies of the ranges are then merged, and the count
+# matrices are combined into one CSR matrix, with the same columns as a
+# CountVectorizer fitted on the whole corpus.
+#
+# Returns the count matrix, the labels, and a CountVectorizer with the merged
+# vocabulary, which computes the same features for new documents. For TF-IDF
+# features, the counts can be passed to a TfidfTransformer.
+def count_words_parallel(corpus_file, n_jobs=None, n_shards=None,
+                         lowercase=True, token_pattern=r"(?u)\b\w\w+\b"):
+    if n_jobs is None:
+        n_jobs = mp.cpu_count()
+    if n_shards is None:
+        n_shards = n_jobs
+    tasks = [(corpus_file, start, end, lowercase, token_pattern)
+             for start, end in byte_ranges(corpus_file, n_shards)]
+    with mp.Pool(n_jobs) as pool:
+        shards = pool.map(count_shard, tasks)
+
+    # The merged vocabulary is sorted, like the one of CountVectorizer, so
+    # the columns of a shard are mapped to the merged vocabulary by a binary
+    # search of its terms.
+    terms = np.unique(np.concatenate([shard_terms for _, shard_terms, _ in shards]))
+    Y = []
+    matrices = []
+    for shard_Y, shard_terms, counts in shards:
+        Y.extend(shard_Y)
+        columns = np.searchsorted(terms, shard_terms)
+        matrices.append(sp.csr_matrix((counts.data, columns[counts.indices], counts.indptr),
+                                      shape=(counts.shape[0], len(terms))))
+    X = sp.vstack(matrices, format='csr')
+
+    vectorizer = CountVectorizer(lowercase=lowercase, token_pattern=token_pattern,
+                                 vocabulary={term: j for j, term in enumerate(terms)})
+    return X, Y, vectorizer
+
+# The parameters of a CountVectorizer or TfidfVectorizer that can be used
+# with count_words_parallel. The others must have their default values.
+PARALLEL_VECTORIZER_PARAMS = ['lowercase', 'token_pattern', 'dtype', 'norm',
+                              'use_idf', 'smooth_idf', 'sublinear_tf']
+
+# Computes the output of the vectorizer (a CountVectorizer or TfidfVectorizer)
+# for a train/test split of the corpus, counting the words in n_jobs processes
+# with count_words_parallel. The rows of the count matrix are split with
+# train_test_split in the same way as the documents would be, and as if the
+# vectorizer were fitted on the training part only, the vocabulary only
+# contains the words of the training part and the IDF weights are computed
+# from it. This gives the same features as the vectorizer, up to rounding.
+#
+# Returns the training and test features and labels, and a fitted copy of the
+# vectorizer with the vocabulary of the training part.
+def vectorize_parallel(corpus_file, vectorizer, test_size, random_state, n_jobs):
+    if not isinstance(vectorizer, CountVectorizer):
+        raise Exception("parallel counting needs a CountVectorizer or TfidfVectorizer")
+    defaults = type(vectorizer)().get_params()
+    for name, value in vectorizer.get_params().items():
+        if name not in PARALLEL_VECTORIZER_PARAMS and value != defaults[name]:
+            raise Exception(f"parallel counting does not support the parameter {name}")
+
+    X, Y, counter = count_words_parallel(corpus_file, n_jobs,
+                                         lowercase=vectorizer.lowercase,
+                                         token_pattern=vectorizer.token_pattern)
+    train, test = train_test_split(np.arange(X.shape[0]), test_size=test_size,
+                                   random_state=random_state)
+    Y = np.array(Y)
+    columns = np.flatnonzero(X[train].getnnz(axis=0))
+    Xtrain = X[train][:, columns]
+    Xtest = X[test][:, columns]
+    terms = counter.get_feature_names_out()[columns]
+
+    # Since the vocabulary is fixed, fitting on an empty document only sets
+    # up the vocabulary. The IDF weights are then set from the counts.
+    fitted = clone(vectorizer).set_params(vocabulary={term: j for j, term in enumerate(terms)})
+    fitted.fit([''])
+    if isinstance(vectorizer, TfidfVectorizer):
+        transformer = TfidfTransformer(norm=vectorizer.norm, use_idf=vectorizer.use_idf,
+                                       smooth_idf=vectorizer.smooth_idf,
+                                       sublinear_tf=vectorizer.sublinear_tf)
+        Xtrain = transformer.fit_transform(Xtrain)
+        Xtest = transformer.transform(Xtest)
+        if vectorizer.use_idf:
+            fitted.idf_ = transformer.idf_
+    Xtrain = Xtrain.astype(vectorizer.dtype, copy=False)
+    Xtest = Xtest.astype(vectorizer.dtype, copy=False)
+    return Xtrain, Xtest, Y[train], Y[test], fitted
+
+# Increase this if the format of the cached files changes.
+CACHE_VERSION = 1
+
+# Computes the SHA-256 hash of the content of a file, reading it in blocks.
+def file_hash(filename, block_size=2**20):
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+# Computes the key of the feature cache from the content of the corpus file,
+# the parameters of the preprocessing steps, and the train/test split.
+# Functions among the parameters (e.g. the score function of SelectKBest) are
+# represented by their names.
+def cache_key(corpus_file, features, test_size, random_state):
+    params = {name: value for name, value in features.get_params(deep=True).items()
+              if name not in ['steps', 'memory'] and name not in features.named_steps}
+    description = {
+        'version': CACHE_VERSION,
+        'corpus': file_hash(corpus_file),
+        'steps': [type(step).__name__ for _, step in features.steps],
+        'params': params,
+        'test_size': test_size,
+        'random_state': random_state,
+    }
+    def name(value):
+        return getattr(value, '__module__', '') + '.' + getattr(value, '__qualname__', repr(value))
+    text = json.dumps(description, sort_keys=True, default=name)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+# Stores a feature matrix in a file with the given name and no extension:
+# a sparse matrix is stored in CSR format in an .npz file, and a dense matrix
+# (e.g. from RandomFourierFeatures) in an .npy file.
+def save_matrix(filename, X):
+    if isinstance(X, np.ndarray):
+        np.save(filename + '.npy', X)
+    else:
+        sp.save_npz(filename + '.npz', sp.csr_matrix(X))
+
+# Loads a feature matrix stored by save_matrix.
+def load_matrix(filename):
+    if os.path.exists(filename + '.npy'):
+        return np.load(filename + '.npy')
+    return sp.load_npz(filename + '.npz')
+
+# Reads the corpus, splits it into training and test parts, and applies the
+# preprocessing steps in the pipeline features. The feature matrices, the
+# labels and the fitted preprocessing steps are stored in the cache
+# directory, under a key computed from the content of the corpus file and the
+# parameters. If the same corpus has been preprocessed in the same way
+# before, the stored results are loaded instead.
+#
+# If n_jobs is more than 1, the first step must be a CountVectorizer or
+# TfidfVectorizer, and the words are counted in n_jobs processes (see
+# vectorize_parallel). The features are the same, so n_jobs is not part of
+# the key.
+def cached_features(corpus_file, features, cache_dir='cache', test_size=0.2,
+                    random_state=0, n_jobs=1):
+    path = os.path.join(cache_dir, cache_key(corpus_file, features, test_size, random_state))
+
+    if os.path.isdir(path):
+        Xtrain = load_matrix(os.path.join(path, 'Xtrain'))
+        Xtest = load_matrix(os.path.join(path, 'Xtest'))
+        Ytrain = np.load(os.path.join(path, 'Ytrain.npy'))
+        Ytest = np.load(os.path.join(path, 'Ytest.npy'))
+        with open(os.path.join(path, 'features.pkl'), 'rb') as f:
+            features = pickle.load(f)
+        return Xtrain, Xtest, Ytrain, Ytest, features
+
+    if n_jobs > 1:
+        name, vectorizer = features.steps[0]
+        Xtrain, Xtest, Ytrain, Ytest, vectorizer = vectorize_parallel(
+            corpus_file, vectorizer, test_size, random_state, n_jobs)
+        features.set_params(**{name: vectorizer})
+        if len(features) > 1:
+            Xtrain = features[1:].fit_transform(Xtrain, Ytrain)
+            Xtest = features[1:].transform(Xtest)
+    else:
+        X, Y = read_data(corpus_file)
+        Xtrain, Xtest, Ytrain, Ytest = train_test_split(X, Y, test_size=test_size,
+                                                        random_state=random_state)
+        Xtrain = features.fit_transform(Xtrain, Ytrain)
+        Xtest = features.transform(Xtest)
+        Ytrain = np.array(Ytrain)
+        Ytest = np.array(Ytest)
+
+    # Write to a temporary directory first, so that an interrupted run does
+    # not leave a partial entry in the cache.
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=cache_dir)
+    try:
+        save_matrix(os.path.join(tmp, 'Xtrain'), Xtrain)
+        save_matrix(os.path.join(tmp, 'Xtest'), Xtest)
+        np.save(os.path.join(tmp, 'Ytrain.npy'), Ytrain)
+        np.save(os.path.join(tmp, 'Ytest.npy'), Ytest)
+        with open(os.path.join(tmp, 'features.pkl'), 'wb') as f:
+            pickle.dump(features, f)
+        os.rename(tmp, path)
+    except OSError:
+        # Another run may have stored the same entry in the meantime.
+        shutil.rmtree(tmp, ignore_errors=True)
+    return Xtrain, Xtest, Ytrain, Ytest, features
+
 
 if __name__ == '__main__':
-    
-    # Read all the documents.
-    X, Y = read_data('data/all_sentiment_shuffled.txt')
-    
-    # Split into training and test parts.
-    Xtrain, Xtest, Ytrain, Ytest = train_test_split(X, Y, test_size=0.2,
-                                                    random_state=0)
+    parser = argparse.ArgumentParser(description='Trains and evaluates a classifier on the sentiment corpus')
+    parser.add_argument('--rff', help='Approximate an RBF kernel with this number of random Fourier features', type=int)
+    parser.add_argument('-j', '--n-jobs', help='Number of processes that count the words', default=1, type=int)
+    parser.add_argument('corpus', help='Corpus file', nargs='?', default='data/all_sentiment_shuffled.txt')
+    args = parser.parse_args()
 
     # Set up the preprocessing steps and the classifier.
-    pipeline = make_pipeline(
+    steps = [
         TfidfVectorizer(),
         SelectKBest(k=1000),
         Normalizer(),
-
+    ]
+    if args.rff:
+        # The output of RandomFourierFeatures is dense, so mini-batches are
+        # faster.
+        steps.append(RandomFourierFeatures(n_components=args.rff, random_state=0))
+        classifier = PegasosLR(batch_size=256)
+    else:
         # NB that this is our Perceptron, not sklearn.linear_model.Perceptron
-        PegasosLR(),  
-    )
+        classifier = PegasosLR()
+    pipeline = make_pipeline(*steps, classifier)
+
+    # Read all the documents, split into training and test parts, and
+    # compute the features. If this has been done before for the same corpus
+    # and preprocessing steps, the features are loaded from the cache.
+    t0 = time.time()
+    Xtrain, Xtest, Ytrain, Ytest, features = cached_features(
+        args.corpus, pipeline[:-1], n_jobs=args.n_jobs)
+    t1 = time.time()
+    print('Preprocessing time: {:.2f} sec.'.format(t1-t0))
 
     # Train the classifier.
     t0 = time.time()
-    pipeline.fit(Xtrain, Ytrain)
+    classifier.fit(Xtrain, Ytrain)
     t1 = time.time()
     print('Training time: {:.2f} sec.'.format(t1-t0))
 
     # Evaluate on the test set.
-    Yguess = pipeline.predict(Xtest)
+    Yguess = classifier.predict(Xtest)
     print('Accuracy: {:.4f}.'.format(accuracy_score(Ytest, Yguess)))
 
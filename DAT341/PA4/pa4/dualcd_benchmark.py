@@ -0,0 +1,67 @@
+import argparse
+import time
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import Normalizer
+from sklearn.pipeline import make_pipeline
+from sklearn.feature_selection import SelectKBest
+from sklearn.metrics import accuracy_score
+
+from aml_perceptron import PegasosSVC, DualCDSVC
+from doc_classification import cached_features
+
+# Compares dual coordinate descent with Pegasos for training a linear SVM on
+# the sentiment corpus. First, we find the optimal value of the objective by
+# running DualCDSVC with a small tolerance. Then we measure the wall-clock
+# time that each learner needs to come within a given fraction of the
+# optimum. The objective is computed on the training set after each epoch,
+# and the time for this is not counted.
+
+# Trains a classifier until its objective on the training set is at most
+# target, or until it has made all its epochs. Returns the list of
+# (epoch, training time, objective) after each epoch.
+def run_to_target(classifier, X, Y, target):
+    trace = []
+    excluded = 0.0
+    def callback(info):
+        nonlocal excluded
+        t0 = time.perf_counter()
+        objective = classifier.objective(X, Y)
+        t1 = time.perf_counter()
+        trace.append((info['epoch'], t0 - start - excluded, objective))
+        excluded += t1 - t0
+        return objective <= target
+    classifier.set_params(callback=callback)
+    start = time.perf_counter()
+    classifier.fit(X, Y)
+    return trace
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares dual coordinate descent with Pegasos on time to a target objective')
+    parser.add_argument('-l', '--lambda-reg', help='Regularisation parameter', default=0.001, type=float)
+    parser.add_argument('-g', '--gap', help='Target relative distance to the optimal objective', default=0.01, type=float)
+    parser.add_argument('-n', '--n-iter', help='Maximal number of epochs', default=100, type=int)
+    parser.add_argument('corpus', help='Corpus file', nargs='?', default='data/all_sentiment_shuffled.txt')
+    args = parser.parse_args()
+
+    features = make_pipeline(
+        TfidfVectorizer(),
+        SelectKBest(k=1000),
+        Normalizer(),
+    )
+    Xtrain, Xtest, Ytrain, Ytest, features = cached_features(args.corpus, features)
+
+    reference = DualCDSVC(lambda_reg=args.lambda_reg, tol=1e-4)
+    reference.fit(Xtrain, Ytrain)
+    optimum = reference.objective(Xtrain, Ytrain)
+    target = optimum * (1 + args.gap)
+    print('Optimal objective: {:.6f}, target: {:.6f}'.format(optimum, target))
+
+    print('{:>10} {:>7} {:>10} {:>10} {:>9}'.format('learner', 'epochs', 'time', 'objective', 'accuracy'))
+    for learner in [DualCDSVC(lambda_reg=args.lambda_reg, n_iter=args.n_iter, tol=0.0),
+                    PegasosSVC(lambda_reg=args.lambda_reg, n_iter=args.n_iter)]:
+        epoch, seconds, objective = run_to_target(learner, Xtrain, Ytrain, target)[-1]
+        reached = '' if objective <= target else ' (target not reached)'
+        print('{:>10} {:>7} {:>9.2f}s {:>10.6f} {:>9.4f}{}'.format(
+            type(learner).__name__, epoch, seconds, objective,
+            accuracy_score(Ytest, learner.predict(Xtest)), reached))
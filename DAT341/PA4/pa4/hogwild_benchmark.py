@@ -0,0 +1,57 @@
+import argparse
+import time
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import Normalizer
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+
+from aml_perceptron import SparsePerceptron, PegasosLR
+from doc_classification import read_data
+
+# Measures the speedup of Hogwild training over serial training for
+# SparsePerceptron and PegasosLR on the sentiment corpus, and checks that the
+# accuracy stays the same. The serial version is always run first as the
+# reference for the speedup and the difference in accuracy.
+# We use the full TF-IDF vocabulary without feature selection, since Hogwild
+# relies on the updates being sparse.
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks Hogwild training against serial training')
+    parser.add_argument('-w', '--workers', help='Numbers of Hogwild workers to try (the serial version is always run)', default=[2, 4, 8], type=int, nargs='+')
+    parser.add_argument('-n', '--n-iter', help='Number of epochs', default=20, type=int)
+    parser.add_argument('corpus', help='Corpus file', nargs='?', default='data/all_sentiment_shuffled.txt')
+    args = parser.parse_args()
+
+    X, Y = read_data(args.corpus)
+    Xtrain, Xtest, Ytrain, Ytest = train_test_split(X, Y, test_size=0.2,
+                                                    random_state=0)
+
+    vectorizer = TfidfVectorizer()
+    normalizer = Normalizer()
+    Xtrain = normalizer.fit_transform(vectorizer.fit_transform(Xtrain))
+    Xtest = normalizer.transform(vectorizer.transform(Xtest))
+
+    # Trains a classifier and returns the training time and the accuracy.
+    def run(classifier):
+        t0 = time.time()
+        classifier.fit(Xtrain, Ytrain)
+        t1 = time.time()
+        return t1-t0, accuracy_score(Ytest, classifier.predict(Xtest))
+
+    for learner in [SparsePerceptron, PegasosLR]:
+        print(learner.__name__)
+        print('{:>8} {:>10} {:>8} {:>9} {:>10}'.format('workers', 'time', 'speedup', 'accuracy', 'difference'))
+
+        # The serial version is always the reference, whatever the numbers
+        # of workers are.
+        serial_time, serial_accuracy = run(learner(n_iter=args.n_iter, n_jobs=1))
+        print('{:>8} {:>9.2f}s {:>7.2f}x {:>9.4f} {:>+10.4f}'.format(
+            'serial', serial_time, 1.0, serial_accuracy, 0.0))
+
+        for n_workers in args.workers:
+            if n_workers == 1:
+                continue
+            seconds, accuracy = run(learner(n_iter=args.n_iter, n_jobs=n_workers))
+            print('{:>8} {:>9.2f}s {:>7.2f}x {:>9.4f} {:>+10.4f}'.format(
+                n_workers, seconds, serial_time/seconds, accuracy, accuracy-serial_accuracy))
@@ -0,0 +1,63 @@
+import argparse
+import time
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import Normalizer
+from sklearn.pipeline import make_pipeline
+from sklearn.feature_selection import SelectKBest
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+
+from aml_perceptron import PegasosSVC, PegasosLR, ParameterMixing
+from doc_classification import read_data
+
+# Compares iterative parameter mixing with serial training for the Pegasos
+# learners on the sentiment corpus: for each epoch, we print the time of the
+# epoch and the value of the objective function on the training set.
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares parameter mixing with serial Pegasos training')
+    parser.add_argument('-w', '--num-workers', help='Number of workers', default=4, type=int)
+    parser.add_argument('-n', '--n-iter', help='Number of epochs', default=20, type=int)
+    parser.add_argument('corpus', help='Corpus file', nargs='?', default='data/all_sentiment_shuffled.txt')
+    args = parser.parse_args()
+
+    X, Y = read_data(args.corpus)
+    Xtrain, Xtest, Ytrain, Ytest = train_test_split(X, Y, test_size=0.2,
+                                                    random_state=0)
+
+    features = make_pipeline(
+        TfidfVectorizer(),
+        SelectKBest(k=1000),
+        Normalizer(),
+    )
+    Xtrain = features.fit_transform(Xtrain, Ytrain)
+    Xtest = features.transform(Xtest)
+    classes = sorted(set(Ytrain))
+
+    for learner in [PegasosSVC, PegasosLR]:
+        # Serial training, one epoch at a time.
+        serial = learner(n_iter=args.n_iter)
+        serial_times = []
+        serial_objectives = []
+        for epoch in range(args.n_iter):
+            t0 = time.time()
+            serial.partial_fit(Xtrain, Ytrain, classes=classes)
+            t1 = time.time()
+            serial_times.append(t1-t0)
+            serial_objectives.append(serial.objective(Xtrain, Ytrain))
+
+        mixing = ParameterMixing(learner(n_iter=args.n_iter), n_jobs=args.num_workers)
+        mixing.fit(Xtrain, Ytrain)
+
+        print(f'{learner.__name__}, {args.num_workers} workers')
+        print('{:>6} {:>12} {:>10} {:>12} {:>10}'.format('epoch', 'serial time', 'objective', 'mixing time', 'objective'))
+        for epoch in range(args.n_iter):
+            print('{:>6} {:>11.3f}s {:>10.4f} {:>11.3f}s {:>10.4f}'.format(
+                epoch+1, serial_times[epoch], serial_objectives[epoch],
+                mixing.epoch_times_[epoch], mixing.objectives_[epoch]))
+        print('Total time: serial {:.2f} sec., mixing {:.2f} sec.'.format(
+            sum(serial_times), sum(mixing.epoch_times_)))
+        print('Accuracy: serial {:.4f}, mixing {:.4f}.'.format(
+            accuracy_score(Ytest, serial.predict(Xtest)),
+            accuracy_score(Ytest, mixing.predict(Xtest))))
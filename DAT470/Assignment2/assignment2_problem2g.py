@@ -1,8 +1,25 @@
 import os
 import argparse
+import mmap
+import re
 import sys
 import time
+import zlib
 import multiprocessing as mp
+from itertools import islice
+
+# Number of characters (or bytes) read from a file at a time
+CHUNK_SIZE = 1 << 20
+
+# Number of files per message between the processes: filenames are sent to
+# the workers in lists of this many names, and in the single merger mode, a
+# worker sends the merged counts of this many files in one message
+FILES_PER_MESSAGE = 16
+
+# Bytes that may be part of characters that str.split() treats as whitespace
+# but bytes.split() does not: the ASCII separators \x1c-\x1f, and all
+# non-ASCII characters in UTF-8 (e.g. no-break space)
+NON_ASCII_WHITESPACE = re.compile(rb'[\x1c-\x1f\x80-\xff]')
 
 def get_filenames(path):
     """
@@ -20,55 +37,369 @@ def get_filenames(path):
             if file.endswith('.txt'):
                 yield f'{root}/{file}'
 
-def get_file(path):
+def read_words(path,chunk_size=CHUNK_SIZE):
     """
-    Reads the content of the file and returns it as a string.
+    A generator function: Reads the file in chunks of chunk_size characters
+    and returns the words in it, so the whole file is never kept in memory.
+    A word that is cut by the end of a chunk is carried over and completed
+    with the beginning of the next chunk.
 
     Parameters:
     - path : string, path to a file
+    - chunk_size, int : number of characters to read at a time
 
-    Return value:
-    The content of the file in a string.
+    Yields:
+    The words of the file (whitespace-separated, as in str.split())
     """
     with open(path,'r') as f:
-        return f.read()
+        carry = ''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            words = (carry + chunk).split()
+            # the last word may continue in the next chunk
+            if words and not chunk[-1].isspace():
+                carry = words.pop()
+            else:
+                carry = ''
+            yield from words
+        if carry:
+            yield carry
+
+def read_words_bytes(path,chunk_size=CHUNK_SIZE):
+    """
+    A generator function: Memory-maps the file and returns the words in it
+    as bytes, without decoding. The file is split on ASCII whitespace in
+    chunks of chunk_size bytes, so only one chunk is copied at a time, and a
+    word that is cut by the end of a chunk is carried over to the next chunk.
+
+    Parameters:
+    - path : string, path to a file
+    - chunk_size, int : number of bytes to split at a time
+
+    Yields:
+    The words of the file (bytes)
+    """
+    with open(path,'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            carry = b''
+            for start in range(0, size, chunk_size):
+                chunk = content[start:start + chunk_size]
+                words = (carry + chunk).split()
+                # the last word may continue in the next chunk
+                if words and not chunk[-1:].isspace():
+                    carry = words.pop()
+                else:
+                    carry = b''
+                yield from words
+            if carry:
+                yield carry
+
+def split_non_ascii_whitespace(counts):
+    """
+    Splits the words (bytes) in counts that contain non-ASCII whitespace,
+    so that the counts are the same as if the text had been decoded and
+    split with str.split(). Only the distinct words are checked.
+
+    Parameters:
+    - counts, dictionary : a mapping from words (bytes) to counts (int), updated in place
+
+    Return value: None
+    """
+    for word in [word for word in counts if NON_ASCII_WHITESPACE.search(word)]:
+        text = word.decode('utf-8')
+        parts = text.split()
+        if parts != [text]:
+            count = counts.pop(word)
+            for part in parts:
+                part = part.encode('utf-8')
+                counts[part] = counts.get(part, 0) + count
+
+def get_batches(words,batch_size):
+    """
+    A generator function: Groups a stream of words into lists of batch_size
+    words (the last one may be shorter).
+
+    Parameters:
+    - words, iterable : the words
+    - batch_size, int : number of words in a batch
+
+    Yields:
+    Lists of words
+    """
+    words = iter(words)
+    while True:
+        batch = list(islice(words, batch_size))
+        if not batch:
+            break
+        yield batch
+
+def count_words(filename,batch_size,chunk_size=CHUNK_SIZE,use_bytes=False):
+    """
+    Counts the number of occurrences of words in one file
+    Whitespace is ignored
+    The file is read in chunks and the words are counted in batches, so
+    each word is tokenized once and memory use does not depend on the file size
+    If use_bytes is True, the file is memory-mapped and the words are counted
+    as bytes, without decoding
+
+    Parameters:
+    - filename, string : the name of a file
+    - batch_size, int : size of batches to process (number of words)
+    - chunk_size, int : number of characters to read from a file at a time
+    - use_bytes, bool : count the words as bytes (str otherwise)
+
+    Returns: Dictionary that maps words to counts (ints)
+    """
+    if use_bytes:
+        words = read_words_bytes(filename, chunk_size)
+    else:
+        words = read_words(filename, chunk_size)
+    counts = dict()
+    # batch processing
+    for batch in get_batches(words, batch_size):
+        for word in batch:
+            if word in counts:
+                counts[word] += 1
+            else:
+                counts[word] = 1
+    if use_bytes:
+        split_non_ascii_whitespace(counts)
+    return counts
+
+def get_queued_filenames(filename_queue):
+    """
+    A generator function: Returns the filenames from a queue that contains
+    lists of filenames, until a None is encountered
 
-def count_words_in_file(filename_queue,wordcount_queue,batch_size):
+    Parameters:
+    - filename_queue, multiprocessing queue : will contain lists of filenames and None as a sentinel to indicate end of input
+
+    Yields:
+    The filenames
+    """
+    while True:
+        filenames = filename_queue.get()
+        if filenames is None:
+            break
+        yield from filenames
+
+def count_words_in_file(filename_queue,wordcount_queue,batch_size,chunk_size=CHUNK_SIZE,use_bytes=False,done_queue=None,files_per_message=FILES_PER_MESSAGE):
     """
     Counts the number of occurrences of words in the file
     Performs counting until a None is encountered in the queue
-    Counts are stored in wordcount_queue
-    Whitespace is ignored
+    Counts are stored in wordcount_queue, merged for files_per_message files
+    at a time, so that there are fewer and larger messages
 
     Parameters:
-    - filename_queue, multiprocessing queue :  will contain filenames and None as a sentinel to indicate end of input
+    - filename_queue, multiprocessing queue :  will contain lists of filenames and None as a sentinel to indicate end of input
     - wordcount_queue, multiprocessing queue : (word,count) dictionaries are put in the queue, and end of input is indicated with a None
-    - batch_size, int : size of batches to process
+    - batch_size, int : size of batches to process (number of words)
+    - chunk_size, int : number of characters to read from a file at a time
+    - use_bytes, bool : count the words as bytes (str otherwise)
+    - done_queue, multiprocessing queue : if given, the time when the worker is done counting is put there
+    - files_per_message, int : number of files whose counts are sent in one message
 
     Returns: None
     """
-    while True:
-        filename = filename_queue.get()
-        if filename is None:
-            wordcount_queue.put(None)
-            break
-        content = get_file(filename)
-        counts = dict()
-        # batch processing
-        for i in range(0, len(content.split()), batch_size):
-            batch = content.split()[i:i + batch_size]
-            for word in batch:
-                if word in counts:
-                    counts[word] += 1
-                else:
-                    counts[word] = 1
+    counts = dict()
+    num_files = 0
+    for filename in get_queued_filenames(filename_queue):
+        counts = merge_dicts(counts, count_words(filename, batch_size, chunk_size, use_bytes))
+        num_files += 1
+        if num_files == files_per_message:
+            wordcount_queue.put(counts)
+            counts = dict()
+            num_files = 0
+    if num_files > 0:
         wordcount_queue.put(counts)
-        # end of input
-        wordcount_queue.put(None)
-        break
+    # end of input
+    wordcount_queue.put(None)
+    if done_queue is not None:
+        done_queue.put(time.time())
+    return None
+
+def merge_dicts(counts,other):
+    """
+    Merges two word count dictionaries. The smaller one is merged into the
+    larger one, which is returned.
+
+    Parameters:
+    - counts, dictionary : word to count dictionary
+    - other, dictionary : word to count dictionary
+
+    Return value:
+    The merged dictionary (one of the two, updated in place)
+    """
+    if len(other) > len(counts):
+        counts, other = other, counts
+    for word, count in other.items():
+        counts[word] = counts.get(word, 0) + count
+    return counts
+
+def tree_reduce(worker_id,num_workers,counts,inboxes,fan_in=2):
+    """
+    Merges the counts of all workers in a tree: in each round, the workers
+    that are still active form groups of fan_in consecutive workers, and the
+    first worker of each group receives and merges the counts of the others.
+    After O(log num_workers) rounds, worker 0 has the total counts.
+
+    Parameters:
+    - worker_id, int : number of this worker (0, ..., num_workers-1)
+    - num_workers, int : number of workers
+    - counts, dictionary : the counts of this worker
+    - inboxes, list of multiprocessing queues : one queue per worker, where the other workers send their counts
+    - fan_in, int : number of workers merged in each group (2 for a binary tree)
+
+    Return value:
+    The total counts for worker 0, None for the other workers
+    """
+    step = 1
+    while step < num_workers:
+        group_size = step * fan_in
+        if worker_id % group_size != 0:
+            # send our counts to the first worker of the group and stop
+            inboxes[worker_id - worker_id % group_size].put(counts)
+            return None
+        # receive the counts of the other members of the group, in any order
+        members = len(range(worker_id + step, min(worker_id + group_size, num_workers), step))
+        for i in range(members):
+            counts = merge_dicts(counts, inboxes[worker_id].get())
+        step = group_size
+    return counts
+
+def count_and_reduce(worker_id,num_workers,filename_queue,inboxes,out_queue,batch_size,chunk_size=CHUNK_SIZE,use_bytes=False,fan_in=2,done_queue=None):
+    """
+    Counts the words of the files from filename_queue until a None is
+    encountered, keeping one dictionary for all the files of this worker,
+    and then merges the counts of all workers with tree_reduce. Worker 0
+    puts the checksum and the top 10 in out_queue.
+
+    Parameters:
+    - worker_id, int : number of this worker (0, ..., num_workers-1)
+    - num_workers, int : number of workers
+    - filename_queue, multiprocessing queue : will contain lists of filenames and None as a sentinel to indicate end of input
+    - inboxes, list of multiprocessing queues : one queue per worker, used by tree_reduce
+    - out_queue, multiprocessing queue : where worker 0 puts (checksum, top 10)
+    - batch_size, int : size of batches to process (number of words)
+    - chunk_size, int : number of characters to read from a file at a time
+    - use_bytes, bool : count the words as bytes (str otherwise)
+    - fan_in, int : number of workers merged in each group of the tree
+    - done_queue, multiprocessing queue : if given, the time when the worker is done counting is put there
+
+    Returns: None
+    """
+    counts = dict()
+    for filename in get_queued_filenames(filename_queue):
+        counts = merge_dicts(counts, count_words(filename, batch_size, chunk_size, use_bytes))
+    if done_queue is not None:
+        done_queue.put(time.time())
+
+    counts = tree_reduce(worker_id, num_workers, counts, inboxes, fan_in)
+    if counts is not None:
+        out_queue.put((compute_checksum(counts), get_top10(counts)))
+    return None
+
+
+def word_hash(word):
+    """
+    A hash function for words that gives the same value in all processes
+    (the built-in hash of strings is randomized per process unless
+    PYTHONHASHSEED is set, e.g. with the spawn start method)
+
+    Parameters:
+    - word, str or bytes : a word
+
+    Return value:
+    The hash value (int)
+    """
+    if isinstance(word, str):
+        word = word.encode('utf-8')
+    return zlib.crc32(word)
+
+def partition_counts(counts,num_reducers):
+    """
+    Splits a word count dictionary into num_reducers dictionaries, so that
+    each word goes to the reducer word_hash(word) % num_reducers
+
+    Parameters:
+    - counts, dictionary : word to count dictionary
+    - num_reducers, int : number of reducers
+
+    Return value:
+    A list of num_reducers dictionaries
+    """
+    partitions = [dict() for i in range(num_reducers)]
+    for word, count in counts.items():
+        partitions[word_hash(word) % num_reducers][word] = count
+    return partitions
+
+def count_and_partition(filename_queue,reducer_queues,batch_size,chunk_size=CHUNK_SIZE,use_bytes=False,done_queue=None):
+    """
+    The map side of the shuffle: counts the words of the files from
+    filename_queue until a None is encountered, keeping one dictionary for
+    all the files of this worker, and then sends one partition of the counts
+    to each reducer
+
+    Parameters:
+    - filename_queue, multiprocessing queue : will contain lists of filenames and None as a sentinel to indicate end of input
+    - reducer_queues, list of multiprocessing queues : one queue per reducer
+    - batch_size, int : size of batches to process (number of words)
+    - chunk_size, int : number of characters to read from a file at a time
+    - use_bytes, bool : count the words as bytes (str otherwise)
+    - done_queue, multiprocessing queue : if given, the time when the worker is done counting is put there
+
+    Returns: None
+    """
+    counts = dict()
+    for filename in get_queued_filenames(filename_queue):
+        counts = merge_dicts(counts, count_words(filename, batch_size, chunk_size, use_bytes))
+    if done_queue is not None:
+        done_queue.put(time.time())
+
+    for reducer_queue, partition in zip(reducer_queues, partition_counts(counts, len(reducer_queues))):
+        reducer_queue.put(partition)
+    return None
+
+def reduce_partition(reducer_queue,out_queue,num_workers):
+    """
+    The reduce side of the shuffle: merges the partitions that the workers
+    send to this reducer, which all contain the same disjoint part of the
+    vocabulary. Quits when num_workers partitions have been merged, and puts
+    the checksum and the top 10 of its part of the vocabulary in out_queue
+
+    Parameters:
+    - reducer_queue, multiprocessing queue : where the workers put their partitions for this reducer
+    - out_queue, multiprocessing queue : where (checksum, top 10) is put
+    - num_workers, int : number of workers (i.e., how many partitions to expect)
+
+    Return value: None
+    """
+    counts = dict()
+    for i in range(num_workers):
+        counts = merge_dicts(counts, reducer_queue.get())
+    out_queue.put((compute_checksum(counts), get_top10(counts)))
     return None
 
+def combine_reducer_results(results):
+    """
+    Combines the results of the reducers: since the reducers have disjoint
+    parts of the vocabulary, the checksum is the sum of their checksums, and
+    the top 10 words are among the top 10 words of the reducers
 
+    Parameters:
+    - results, list : (checksum, top 10) pairs from the reducers
+
+    Return value:
+    A tuple (checksum, top 10)
+    """
+    checksum = sum(reducer_checksum for reducer_checksum, top_10 in results)
+    candidates = {word: count for reducer_checksum, top_10 in results for count, word in top_10}
+    return checksum, get_top10(candidates)
 
 def get_top10(counts):
     """
@@ -76,7 +407,7 @@ def get_top10(counts):
     Ties can be solved arbitrarily.
 
     Parameters:
-    - counts, dictionary : a mapping from words (str) to counts (int)
+    - counts, dictionary : a mapping from words (str or UTF-8 bytes) to counts (int)
     
     Return value:
     A list of (count,word) pairs (int,str)
@@ -85,7 +416,8 @@ def get_top10(counts):
     
     top_10 = sorted_counts[:10]
     
-    top_10_pairs = [(count, word) for word, count in top_10]
+    top_10_pairs = [(count, word.decode('utf-8') if isinstance(word, bytes) else word)
+                    for word, count in top_10]
     
     return top_10_pairs
 
@@ -98,7 +430,7 @@ def merge_counts(out_queue,wordcount_queue,num_workers):
 
     Parameters:
     - global_counts, manager dict : global dictionary where to store the counts
-    - wordcount_queue, manager queue : queue that contains (word,count) pairs and Nones to signal end of input from a worker
+    - wordcount_queue, multiprocessing queue : queue that contains (word,count) dictionaries and Nones to signal end of input from a worker
     - num_workers, int : number of workers (i.e., how many Nones to expect)
 
     Return value: None
@@ -124,6 +456,7 @@ def compute_checksum(counts):
     """
     Computes the checksum for the counts as follows:
     The checksum is the sum of products of the length of the word and its count
+    For words stored as UTF-8 bytes, the length is the number of characters
 
     Parameters:
     - counts, dictionary : word to count dictionary
@@ -133,14 +466,128 @@ def compute_checksum(counts):
     """
     checksum = 0
     for word, count in counts.items():
+        if isinstance(word, bytes) and not word.isascii():
+            word = word.decode('utf-8')
         checksum += len(word) * count
     return checksum
 
 
+def run_word_count(path,num_workers,batch_size,chunk_size=CHUNK_SIZE,use_bytes=False,merge='single',fan_in=2,num_reducers=None,transport='queue',files_per_message=FILES_PER_MESSAGE):
+    """
+    Counts the words of all the text files in path with num_workers worker
+    processes, and merges the counts either in a single merger process
+    (merge='single'), in a tree of the workers (merge='tree'), or in
+    num_reducers reducer processes that each merge a disjoint part of the
+    vocabulary, as in MapReduce (merge='shuffle').
+
+    The processes communicate through plain multiprocessing queues, which
+    send the pickled messages directly through pipes (transport='queue'),
+    or through the queues of a Manager (transport='manager'), where every
+    put and get is a request to the separate manager process.
+
+    Parameters:
+    - path, string : path that contains text files
+    - num_workers, int : number of workers
+    - batch_size, int : size of batches to process (number of words)
+    - chunk_size, int : number of characters to read from a file at a time
+    - use_bytes, bool : count the words as bytes (str otherwise)
+    - merge, string : 'single', 'tree' or 'shuffle'
+    - fan_in, int : number of workers merged in each group of the tree
+    - num_reducers, int : number of reducers for the shuffle (default: num_workers)
+    - transport, string : 'queue' or 'manager'
+    - files_per_message, int : number of filenames (and, in the single merger mode, file counts) per message
+
+    Return value:
+    A tuple (checksum, top 10, total time, merge time), where the merge time
+    is the time from when the last worker is done counting until the result
+    is ready
+    """
+    start = time.time()
+
+    # construct workers and queues
+    if transport == 'manager':
+        manager = mp.Manager()
+        make_queue = manager.Queue
+    elif transport == 'queue':
+        manager = None
+        make_queue = mp.Queue
+    else:
+        raise ValueError(f'unknown transport {transport}')
+    filename_queue = make_queue()
+    out_queue = make_queue()
+    done_queue = make_queue()
+
+    # worker processes
+    workers = []
+    if merge == 'single':
+        wordcount_queue = make_queue()
+        for i in range(num_workers):
+            worker = mp.Process(target=count_words_in_file, args=(filename_queue, wordcount_queue, batch_size, chunk_size, use_bytes, done_queue, files_per_message))
+            worker.start()
+            workers.append(worker)
+
+        # construct a special merger process
+        merger = mp.Process(target=merge_counts, args=(out_queue, wordcount_queue, num_workers))
+        merger.start()
+        workers.append(merger)
+    elif merge == 'tree':
+        inboxes = [make_queue() for i in range(num_workers)]
+        for i in range(num_workers):
+            worker = mp.Process(target=count_and_reduce, args=(i, num_workers, filename_queue, inboxes, out_queue, batch_size, chunk_size, use_bytes, fan_in, done_queue))
+            worker.start()
+            workers.append(worker)
+    elif merge == 'shuffle':
+        if num_reducers is None:
+            num_reducers = num_workers
+        reducer_queues = [make_queue() for i in range(num_reducers)]
+        for i in range(num_workers):
+            worker = mp.Process(target=count_and_partition, args=(filename_queue, reducer_queues, batch_size, chunk_size, use_bytes, done_queue))
+            worker.start()
+            workers.append(worker)
+        for reducer_queue in reducer_queues:
+            reducer = mp.Process(target=reduce_partition, args=(reducer_queue, out_queue, num_workers))
+            reducer.start()
+            workers.append(reducer)
+    else:
+        raise ValueError(f'unknown merge mode {merge}')
+
+    # put lists of filenames into the input queue
+    for filenames in get_batches(get_filenames(path), files_per_message):
+        filename_queue.put(filenames)
+
+    # put None in queue to signal end of input
+    for i in range(num_workers):
+        filename_queue.put(None)
+
+    # the merger (or worker 0, or each reducer) shall return the checksum and
+    # top 10 through the out queue
+    if merge == 'shuffle':
+        checksum, top_10 = combine_reducer_results([out_queue.get() for i in range(num_reducers)])
+    else:
+        checksum, top_10 = out_queue.get()
+    end = time.time()
+
+    # with plain queues, the messages must be taken out of the queue before
+    # joining the process that put them there
+    done_counting = max(done_queue.get() for i in range(num_workers))
+    for worker in workers:
+        worker.join()
+    if manager is not None:
+        manager.shutdown()
+    return checksum, top_10, end - start, end - done_counting
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Counts words of all the text files in the given directory')
     parser.add_argument('-w', '--num-workers', help = 'Number of workers', default=1, type=int)
     parser.add_argument('-b', '--batch-size', help = 'Batch size', default=1, type=int)
+    parser.add_argument('-c', '--chunk-size', help = 'Number of characters to read from a file at a time', default=CHUNK_SIZE, type=int)
+    parser.add_argument('--bytes', help = 'Memory-map the files and count words as bytes', action='store_true')
+    parser.add_argument('-m', '--merge', help = 'Merge the counts in a single merger process, in a tree of the workers, or in hash-partitioned reducers', choices=['single', 'tree', 'shuffle'], default='single')
+    parser.add_argument('-f', '--fan-in', help = 'Number of workers merged in each group of the tree', default=2, type=int)
+    parser.add_argument('-r', '--num-reducers', help = 'Number of reducers for the shuffle (default: number of workers)', type=int)
+    parser.add_argument('-t', '--transport', help = 'Send the messages through plain multiprocessing queues or through Manager queues', choices=['queue', 'manager'], default='queue')
+    parser.add_argument('-n', '--files-per-message', help = 'Number of files per message', default=FILES_PER_MESSAGE, type=int)
     parser.add_argument('path', help = 'Path that contains text files')
     args = parser.parse_args()
 
@@ -160,39 +607,24 @@ if __name__ == '__main__':
         sys.stderr.write(f'{sys.argv[0]}: ERROR: Batch size must be positive (got {batch_size})!\n')
         quit(1)
 
-    # construct workers and queues
-    manager = mp.Manager()
-    filename_queue = manager.Queue()
-    wordcount_queue = manager.Queue()
-    out_queue = manager.Queue()
-
-    # worker processes
-    workers = []
-    for i in range(num_workers):
-        worker = mp.Process(target=count_words_in_file, args=(filename_queue, wordcount_queue, batch_size))
-        worker.start()
-        workers.append(worker)
+    chunk_size = args.chunk_size
+    if chunk_size < 1:
+        sys.stderr.write(f'{sys.argv[0]}: ERROR: Chunk size must be positive (got {chunk_size})!\n')
+        quit(1)
 
-    # construct a special merger process
-    merger = mp.Process(target=merge_counts, args=(out_queue, wordcount_queue, num_workers))
-    merger.start()
+    if args.fan_in < 2:
+        sys.stderr.write(f'{sys.argv[0]}: ERROR: Fan-in must be at least 2 (got {args.fan_in})!\n')
+        quit(1)
 
-    # put filenames into the input queue
-    for filename in get_filenames(path):
-        filename_queue.put(filename)
+    if args.num_reducers is not None and args.num_reducers < 1:
+        sys.stderr.write(f'{sys.argv[0]}: ERROR: Number of reducers must be positive (got {args.num_reducers})!\n')
+        quit(1)
 
-    # put None in queue to signal end of input
-    for i in range(num_workers):
-        filename_queue.put(None)
-    
-    # wait for all workers to finish
-    for worker in workers:
-        worker.join()
+    if args.files_per_message < 1:
+        sys.stderr.write(f'{sys.argv[0]}: ERROR: Number of files per message must be positive (got {args.files_per_message})!\n')
+        quit(1)
 
-    # workers then put dictionaries for the merger
-    # the merger shall return the checksum and top 10 through the out queue
-    checksum, top_10 = out_queue.get()
-    merger.join()
+    checksum, top_10, total_time, merge_time = run_word_count(path, num_workers, batch_size, chunk_size, args.bytes, args.merge, args.fan_in, args.num_reducers, args.transport, args.files_per_message)
 
     # print the checksum and top 10
     print(f'Checksum: {checksum}')
@@ -0,0 +1,65 @@
+import os
+import argparse
+import sys
+
+from assignment2_problem2g import run_word_count
+
+def benchmark(path,num_workers,batch_size,use_bytes,merge,fan_in,repeats,num_reducers=None,transport='queue'):
+    """
+    Runs the word count repeats times and returns the best times.
+
+    Parameters:
+    - path, string : path that contains text files
+    - num_workers, int : number of workers
+    - batch_size, int : size of batches to process (number of words)
+    - use_bytes, bool : count the words as bytes (str otherwise)
+    - merge, string : 'single', 'tree' or 'shuffle'
+    - fan_in, int : number of workers merged in each group of the tree
+    - repeats, int : number of runs
+    - num_reducers, int : number of reducers for the shuffle (default: num_workers)
+    - transport, string : 'queue' or 'manager'
+
+    Return value:
+    A tuple (checksum, best total time, best merge time)
+    """
+    total_times = []
+    merge_times = []
+    for i in range(repeats):
+        checksum, top_10, total_time, merge_time = run_word_count(
+            path, num_workers, batch_size, use_bytes=use_bytes, merge=merge, fan_in=fan_in,
+            num_reducers=num_reducers, transport=transport)
+        total_times.append(total_time)
+        merge_times.append(merge_time)
+    return checksum, min(total_times), min(merge_times)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares merging the word counts in a single merger process with a tree merge in the workers and a hash-partitioned shuffle')
+    parser.add_argument('-w', '--workers', help = 'Numbers of workers to try', default=[1, 2, 4, 8, 16], type=int, nargs='+')
+    parser.add_argument('-b', '--batch-size', help = 'Batch size', default=1000, type=int)
+    parser.add_argument('-f', '--fan-in', help = 'Number of workers merged in each group of the tree', default=2, type=int)
+    parser.add_argument('-r', '--repeats', help = 'Number of runs (the best time is reported)', default=3, type=int)
+    parser.add_argument('--num-reducers', help = 'Number of reducers for the shuffle (default: number of workers)', type=int)
+    parser.add_argument('-t', '--transport', help = 'Send the messages through plain multiprocessing queues or through Manager queues', choices=['queue', 'manager'], default='queue')
+    parser.add_argument('--bytes', help = 'Memory-map the files and count words as bytes', action='store_true')
+    parser.add_argument('path', help = 'Path that contains text files')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.path):
+        sys.stderr.write(f'{sys.argv[0]}: ERROR: `{args.path}\' is not a valid directory!\n')
+        quit(1)
+
+    # the merge time is the time from when the last worker is done counting
+    # until the result is ready
+    modes = ['single', 'tree', 'shuffle']
+    header = ''.join(f" {mode + ' total':>13} {mode + ' merge':>13}" for mode in modes)
+    print(f"{'Workers':<8}{header}")
+    for num_workers in args.workers:
+        results = [benchmark(args.path, num_workers, args.batch_size, args.bytes, mode, args.fan_in, args.repeats, args.num_reducers, args.transport)
+                   for mode in modes]
+        checksums = set(checksum for checksum, total_time, merge_time in results)
+        if len(checksums) > 1:
+            sys.stderr.write(f'{sys.argv[0]}: ERROR: Checksums differ ({checksums})!\n')
+            quit(1)
+        row = ''.join(f' {total_time:>12.2f}s {merge_time:>12.2f}s' for checksum, total_time, merge_time in results)
+        print(f'{num_workers:<8}{row}')
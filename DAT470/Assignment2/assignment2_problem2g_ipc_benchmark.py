@@ -0,0 +1,100 @@
+import argparse
+import time
+import multiprocessing as mp
+
+# Measures the cost of sending the word counts of small files from a worker
+# to another process, for the transports in assignment2_problem2g.py and a
+# plain pipe, with different numbers of files per message. Only the
+# communication is measured: the counts are made up, not read from files.
+
+def make_counts(words_per_file):
+    """
+    Makes a word count dictionary like the one of a small file.
+
+    Parameters:
+    - words_per_file, int : number of distinct words
+
+    Return value:
+    Dictionary that maps words (strings) to counts (ints)
+    """
+    return {f'word{i}': i + 1 for i in range(words_per_file)}
+
+def send_counts(channel,transport,num_files,words_per_file,files_per_message):
+    """
+    Sends the counts of num_files files, files_per_message files per message,
+    followed by None. A None is sent first, to signal that the process has
+    started.
+
+    Parameters:
+    - channel, queue or connection : where to send the messages
+    - transport, string : 'manager', 'queue' or 'pipe'
+    - num_files, int : number of files
+    - words_per_file, int : number of distinct words per file
+    - files_per_message, int : number of files per message
+
+    Returns: None
+    """
+    send = channel.send if transport == 'pipe' else channel.put
+    # distinct dictionaries, since pickle would send a repeated object only once
+    message = [make_counts(words_per_file) for i in range(files_per_message)]
+    send(None)
+    for start in range(0, num_files, files_per_message):
+        send(message[:num_files - start])
+    send(None)
+    return None
+
+def measure(transport,num_files,words_per_file,files_per_message):
+    """
+    Measures the time per file of sending the counts of num_files files from
+    one process to this one.
+
+    Parameters:
+    - transport, string : 'manager', 'queue' or 'pipe'
+    - num_files, int : number of files
+    - words_per_file, int : number of distinct words per file
+    - files_per_message, int : number of files per message
+
+    Return value:
+    The time per file in seconds
+    """
+    manager = None
+    if transport == 'manager':
+        manager = mp.Manager()
+        channel = receiver = manager.Queue()
+    elif transport == 'queue':
+        channel = receiver = mp.Queue()
+    else:
+        receiver, channel = mp.Pipe(duplex=False)
+    receive = receiver.recv if transport == 'pipe' else receiver.get
+
+    sender = mp.Process(target=send_counts, args=(channel, transport, num_files, words_per_file, files_per_message))
+    sender.start()
+    receive()
+    start = time.time()
+    received = 0
+    while True:
+        message = receive()
+        if message is None:
+            break
+        received += len(message)
+    end = time.time()
+    sender.join()
+    if manager is not None:
+        manager.shutdown()
+    assert received == num_files
+    return (end - start) / num_files
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures the IPC overhead per file of the transports of the word counter')
+    parser.add_argument('-f', '--num-files', help = 'Number of files', default=10000, type=int)
+    parser.add_argument('-w', '--words-per-file', help = 'Number of distinct words per file', default=100, type=int)
+    parser.add_argument('-n', '--files-per-message', help = 'Numbers of files per message to try', default=[1, 4, 16, 64], type=int, nargs='+')
+    parser.add_argument('-t', '--transports', help = 'Transports to try', default=['manager', 'queue', 'pipe'], choices=['manager', 'queue', 'pipe'], nargs='+')
+    args = parser.parse_args()
+
+    print('Time per file (microseconds)')
+    print(f"{'Transport':<10}" + ''.join(f'{n:>10}' for n in args.files_per_message))
+    for transport in args.transports:
+        times = [measure(transport, args.num_files, args.words_per_file, n) for n in args.files_per_message]
+        print(f'{transport:<10}' + ''.join(f'{t * 1e6:>10.1f}' for t in times))